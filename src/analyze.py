@@ -33,20 +33,36 @@ myTable = PrettyTable([
     "Constraints", 
     "Timeslots", 
     "Channels", 
+    "Used slots", 
     "Cells available", 
     "Cells used", 
     "Occupancy rate", 
     "Processing time", 
+    "Build time", 
+    "Check time", 
+    "Conflicts", 
+    "Decisions", 
+    "Z3 memory (MB)", 
     "Found"
 ])
 
 idx = 0
 for key, value in logs.items():
-    slotframe_length = value.get('nb_slots', "")
-    slotframe_width = value.get('nb_channels', "") + 1
+    # Skip topologies that failed or timed out in batch mode
+    if value.get('status') in ("failed", "timeout"):
+        print(f"Skipping {key}: {value.get('status')} ({value.get('error', '')})")
+        continue
+    # Slotframe actually used by the schedule when logged, solver bounds otherwise
+    slotframe_length = value.get('used_slots', value.get('nb_slots', ""))
+    slotframe_width = value.get('used_channels', value.get('nb_channels', "")) + 1
     cells_available = slotframe_length * slotframe_width
     cells_used = value.get('nb_edges', "")
     occupancy_rate = cells_used / cells_available
+    # Solver phases profiled during the run (missing in logs of older runs)
+    profile = value.get("profile", {})
+    timers = profile.get("timers", {})
+    z3_summary = profile.get("z3", {})
+    build_time = sum(time for phase, time in timers.items() if phase == "topology" or phase.startswith("constraints."))
     key = key.replace(".json", "")
     header = "+-------------------------------+\n" + f"| Summary {key}            |\n" + "+-------------------------------+"
     data = header + \
@@ -58,6 +74,9 @@ for key, value in logs.items():
         '\n  - Number of constraints: ' + str(value.get("nb_constraints", "")) + \
         '\n  - Number of slots: ' + str(value.get("nb_slots", "")) + \
         '\n  - Number of channels: ' + str(value.get("nb_channels", "")) + \
+        '\n  - Number of used slots: ' + str(value.get("used_slots", "")) + \
+        '\n  - Number of used channels: ' + str(value.get("used_channels", "")) + \
+        '\n  - Objective: ' + str(value.get("objective_function", "")) + ' = ' + str(value.get("objective", "")) + \
         '\n  - Number of retries: ' + str(value.get("nb_retries", "")) + \
         '\n  - Edges: ' + str(value.get("edges", "")) + \
         '\n  - Communications: ' + str(value.get("communications", "")) + \
@@ -66,6 +85,11 @@ for key, value in logs.items():
         '\n  - Number of cells available: ' + str(cells_available) + \
         '\n  - Number of cells used: ' + str(cells_used) + \
         '\n  - Slotframe occupancy rate: ' + str(round(occupancy_rate, 2) * 100) + '%' + \
+        '\n' + \
+        '\n- Solver profile ' + \
+        ''.join(f'\n  - {phase}: {round(time, 3)}s ({profile.get("calls", {}).get(phase, "")} calls)' for phase, time in timers.items()) + \
+        ''.join(f'\n  - z3 {name}: {count}' for name, count in z3_summary.items()) + \
+        '\n  - Number of solver calls: ' + str(len(profile.get("retries", []))) + \
         '\n ' + \
         '\n'
     append_to_text(data, summary_file)
@@ -76,10 +100,16 @@ for key, value in logs.items():
         int(value["nb_constraints"]), 
         int(value.get("nb_slots", "")), 
         int(value.get("nb_channels", "")), 
+        value.get("used_slots", ""), 
         int(cells_available), 
         int(cells_used), 
         int(round(occupancy_rate, 2) * 100), 
         round(float(value.get("processing_time", "")), 3), 
+        round(build_time, 3) if timers else "", 
+        round(timers["check"], 3) if "check" in timers else "", 
+        z3_summary.get("conflicts", ""), 
+        z3_summary.get("decisions", ""), 
+        round(z3_summary["memory"], 2) if "memory" in z3_summary else "", 
         int(value.get("nb_solutions", ""))
     ])
     idx += 1 
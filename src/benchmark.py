@@ -0,0 +1,183 @@
+import argparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from multiprocessing import Pipe, Process
+
+import z3
+
+from generate import generate_topology, get_topology_name
+from main import Main
+from scheduling.schedule import OBJECTIVES, Schedule, select_encoding
+
+from utils.files import read_from_json, write_to_json
+
+# Report fields compared against a baseline report
+TIME_FIELDS = ["constraint_time", "solve_time"]
+
+def benchmark_topology(topology_file, options):
+    # Build constraints and run the solver for one topology, measured in a fresh process
+    main = Main(**options)
+    start_time = time.perf_counter()
+    main.setup_network_topology(topology_file)
+    topology_time = time.perf_counter() - start_time
+
+    # Constraint families of the structural model, built on their own to time constraint generation
+    network = main.network
+    start_time = time.perf_counter()
+    schedule = Schedule(network, options['max_slots'], options['max_channels'], options['symmetry_breaking'], options['encoding'], two_phase=options['two_phase'], objective=options['objective'])
+    constraints = schedule.compute_structural()
+    constraint_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    main.run_tsch_algorithm()
+    solve_time = time.perf_counter() - start_time
+    results = main.tsch_solver.get_result_summary()
+    return {
+        'nb_nodes': len(network.get_nodes()),
+        'nb_edges': len(network.get_edges()),
+        'encoding': select_encoding(options['encoding'], len(network.get_edges())),
+        'nb_constraints': len(constraints),
+        'nb_dependency_constraints': len(schedule.dependency_constraints),
+        'nb_conflict_constraints': len(schedule.conflict_constraints),
+        'nb_timeslot_constraints': len(schedule.timeslot_constraints),
+        'nb_channel_constraints': len(schedule.channel_constraints),
+        'nb_symmetry_constraints': len(schedule.symmetry_constraints),
+        'topology_time': topology_time,
+        'constraint_time': constraint_time,
+        'solve_time': solve_time,
+        # Peak resident memory of the process in kilobytes (z3 included)
+        'peak_memory': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'found': results.get('nb_solutions', 0) > 0,
+        'nb_slots': results.get('nb_slots'),
+        'nb_channels': results.get('nb_channels'),
+        'used_slots': results.get('used_slots'),
+        'used_channels': results.get('used_channels'),
+        'nb_retries': results.get('nb_retries'),
+        # Solver phases and z3 statistics of the run (see Profiler)
+        'timers': results.get('profile', {}).get('timers'),
+        'z3': results.get('profile', {}).get('z3'),
+    }
+
+def run_benchmark_worker(topology_file, options, connection):
+    try:
+        connection.send(("done", benchmark_topology(topology_file, options)))
+    except Exception as error:
+        connection.send(("failed", f"{type(error).__name__}: {error}"))
+    connection.close()
+
+def run_benchmark(topology_file, options, timeout=None):
+    # Run one benchmark in its own process so that peak memory is measured per topology
+    receiver, sender = Pipe(duplex=False)
+    process = Process(target=run_benchmark_worker, args=(topology_file, options, sender))
+    process.start()
+    sender.close()
+    if not receiver.poll(timeout):
+        process.terminate()
+        process.join()
+        return "timeout", f"No result after {timeout} seconds"
+    try:
+        status, payload = receiver.recv()
+    except EOFError:
+        status, payload = "failed", f"Worker exited with code {process.exitcode}"
+    process.join()
+    return status, payload
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_reports(report, baseline, tolerance):
+    # Timings slower than the baseline by more than tolerance (relative), and changed slotframe sizes
+    baseline_results = { result['topology']: result for result in baseline['results'] }
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get(result['topology'])
+        if previous is None or result['status'] != "done" or previous['status'] != "done":
+            continue
+        for field in TIME_FIELDS:
+            if result[field] > previous[field] * (1 + tolerance):
+                regressions.append(f"{result['topology']}: {field} {previous[field]:.3f}s -> {result[field]:.3f}s")
+        for field in ["nb_slots", "nb_channels", "used_slots", "used_channels"]:
+            if result.get(field) != previous.get(field):
+                regressions.append(f"{result['topology']}: {field} {previous.get(field)} -> {result.get(field)}")
+    return regressions
+
+
+if __name__ == "__main__":
+    # Handle arguments
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("--cells", type=int, nargs='+', default=[1, 2, 3], help="numbers of cells of the size sweep")
+    parser.add_argument("--tags", type=int, nargs='+', default=[1, 2], help="numbers of tags per cell of the size sweep")
+    parser.add_argument("--anchors", type=int, default=3, help="number of anchors per cell")
+    parser.add_argument("--overlap", type=int, default=1, help="number of anchors shared with the parent cell")
+    parser.add_argument("--depth", type=int, default=1, help="depth of the forwarding tree of cells")
+    parser.add_argument("--max_slots", type=int, default=4, help="")
+    parser.add_argument("--max_channels", type=int, default=1, help="")
+    parser.add_argument("--max_retries", type=int, default=10, help="")
+    parser.add_argument("--search", type=str, default="linear", choices=["linear", "binary", "greedy"], help="slotframe search of the solver")
+    parser.add_argument("--encoding", type=str, default="auto", help="encoding of timeslots and channels")
+    parser.add_argument("--objective", type=str, default="sum", choices=list(OBJECTIVES), help="objective minimized by the solver")
+    parser.add_argument("--two_phase", action='store_true', help="assign channels after timeslots")
+    parser.add_argument("--symmetry_breaking", action='store_true', help="add symmetry breaking constraints")
+    parser.add_argument("--timeout", type=float, default=300, help="maximum time in seconds per topology")
+    parser.add_argument("--output", type=str, default="../out/benchmark", help="folder of generated topologies and report.json")
+    parser.add_argument("--baseline", type=str, default=None, help="report to compare with, exits with an error on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="relative slowdown tolerated against the baseline")
+    args = parser.parse_args()
+
+    topology_path = os.path.join(args.output, "topologies")
+    if not os.path.exists(topology_path):
+        os.makedirs(topology_path)
+
+    options = {
+        'max_slots': args.max_slots,
+        'max_channels': args.max_channels,
+        'max_retries': args.max_retries,
+        'search': args.search,
+        'encoding': args.encoding,
+        'two_phase': args.two_phase,
+        'objective': args.objective,
+        'symmetry_breaking': args.symmetry_breaking,
+    }
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'z3': z3.get_version_string(),
+        'generator': {'anchors': args.anchors, 'overlap': args.overlap, 'depth': args.depth},
+        'options': options,
+        'results': [],
+    }
+
+    for nb_cells in args.cells:
+        for nb_tags in args.tags:
+            topology = get_topology_name(nb_cells, nb_tags, args.anchors, args.overlap, args.depth)
+            topology_file = os.path.join(topology_path, f"{topology}.json")
+            write_to_json(generate_topology(nb_cells, nb_tags, args.anchors, args.overlap, args.depth), topology_file)
+            print(f"Running benchmark for topology: {topology}")
+            status, payload = run_benchmark(topology_file, options, args.timeout)
+            result = {'topology': topology, 'nb_cells': nb_cells, 'nb_tags': nb_tags, 'status': status}
+            if status == "done":
+                result.update(payload)
+                print(f"{topology}: {payload['nb_edges']} edges, {payload['nb_constraints']} constraints in {payload['constraint_time']:.3f}s, solved in {payload['solve_time']:.3f}s, slotframe {payload['nb_slots']}x{payload['nb_channels']}")
+            else:
+                result['error'] = payload
+                print(f"{topology}: {status} ({payload})")
+            report['results'].append(result)
+
+    report_file = os.path.join(args.output, "report.json")
+    write_to_json(report, report_file)
+    print(f"Report written: {report_file}")
+
+    if args.baseline:
+        regressions = compare_reports(report, read_from_json(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regression against baseline")
@@ -0,0 +1,86 @@
+import argparse
+import os
+
+from utils.files import write_to_json
+
+def generate_topology(nb_cells, nb_tags, nb_anchors=3, overlap=1, depth=1):
+    """ Generate a topology in the input format (cells with tags, anchors, parent and next_parent)
+    :param nb_cells: number of cells, the first cell holds the root anchor a1
+    :param nb_tags: number of tags per cell
+    :param nb_anchors: number of anchors per cell
+    :param overlap: number of anchors a cell shares with its parent cell
+    :param depth: depth of the cell tree, cells form branches of up to depth cells below the first cell
+    :return: dict such {'cell1': {'tags': ['t1'], 'anchors': ['a1', 'a2', 'a3'], 'parent': 'a1', 'next_parent': 'a1'}}
+    """
+    if overlap >= nb_anchors:
+        raise ValueError(f"Anchor overlap ({overlap}) must be lower than the number of anchors per cell ({nb_anchors})")
+    depth = max(depth, 1)
+    cells = {}
+    cell_anchors = []
+    cell_parents = []
+    nb_children = []
+    nb_anchors_created = 0
+    nb_tags_created = 0
+    for i in range(nb_cells):
+        if i == 0:
+            # First cell: all nodes forward to the root anchor
+            parent_cell = None
+            shared = []
+        else:
+            # Cells at the first level hang below the first cell, the following ones below the previous cell
+            parent_cell = 0 if (i - 1) % depth == 0 else i - 1
+            # Shared anchors are taken from the parent cell (excluding its parent anchor), rotating between sibling cells
+            candidates = [ anchor for anchor in reversed(cell_anchors[parent_cell]) if anchor != cell_parents[parent_cell] ]
+            start = nb_children[parent_cell] * overlap
+            shared = [ candidates[(start + k) % len(candidates)] for k in range(overlap) ]
+            nb_children[parent_cell] += 1
+
+        anchors = list(shared)
+        while len(anchors) < nb_anchors:
+            nb_anchors_created += 1
+            anchors.append(f"a{nb_anchors_created}")
+        tags = []
+        for _ in range(nb_tags):
+            nb_tags_created += 1
+            tags.append(f"t{nb_tags_created}")
+
+        if parent_cell is None:
+            parent, next_parent = "a1", "a1"
+        else:
+            # The cell forwards through its first shared anchor (or its first anchor) to the parent anchor of the parent cell
+            parent, next_parent = anchors[0], cell_parents[parent_cell]
+        cell_anchors.append(anchors)
+        cell_parents.append(parent)
+        nb_children.append(0)
+        cells[f"cell{i + 1}"] = {
+            'tags': tags,
+            'anchors': anchors,
+            'parent': parent,
+            'next_parent': next_parent,
+        }
+    return cells
+
+def get_topology_name(nb_cells, nb_tags, nb_anchors=3, overlap=1, depth=1):
+    return f"cell{nb_cells}_t{nb_tags}_a{nb_anchors}_o{overlap}_d{depth}"
+
+
+if __name__ == "__main__":
+    # Handle arguments
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("--topology", type=str, default="generated", help="folder of ../in/ where topologies are written")
+    parser.add_argument("--cells", type=int, nargs='+', default=[2], help="number of cells (one topology per value)")
+    parser.add_argument("--tags", type=int, nargs='+', default=[1], help="number of tags per cell (one topology per value)")
+    parser.add_argument("--anchors", type=int, default=3, help="number of anchors per cell")
+    parser.add_argument("--overlap", type=int, default=1, help="number of anchors shared with the parent cell")
+    parser.add_argument("--depth", type=int, default=1, help="depth of the forwarding tree of cells")
+    args = parser.parse_args()
+
+    output_path = os.path.join("../in/", args.topology)
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    for nb_cells in args.cells:
+        for nb_tags in args.tags:
+            topology = generate_topology(nb_cells, nb_tags, args.anchors, args.overlap, args.depth)
+            topology_file = os.path.join(output_path, f"{get_topology_name(nb_cells, nb_tags, args.anchors, args.overlap, args.depth)}.json")
+            write_to_json(topology, topology_file)
+            print(f"Topology written: {topology_file}")
@@ -2,46 +2,64 @@ import argparse
 import random
 import time
 import os
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
 
 from scheduling.network import NetworkTopology
 from scheduling.node import Tag, Anchor
-from scheduling.solver import UWBTSCHSolver
+from scheduling.cache import ScheduleCache
+from scheduling.profiler import Profiler
+from scheduling.schedule import ENCODINGS, OBJECTIVES
+from scheduling.simulation import TSCHSimulator
+from scheduling.solver import UWBTSCHSolver, PORTFOLIO
 
-from utils.files import read_from_json, write_to_json, write_to_text, get_topology_files
+from utils.files import JsonLinesWriter, read_from_json, write_to_csv, write_to_json, write_to_text, get_topology_files
 
 class Main:
-    def __init__(self, max_solutions=1, max_slots=4, max_channels=1, max_retries=5):
+    def __init__(self, max_solutions=1, max_slots=4, max_channels=1, max_retries=5, search="linear", portfolio=False, cache=None, cache_size=1000, warm_start=False, decompose=False, cell_jobs=1, symmetry_breaking=False, encoding="auto", two_phase=False, time_budget=None, enumeration="optimize", projection="full", sample_factor=1, solution_file=None, profile=False, trace_memory=False, objective="sum"):
         self.max_solutions = max_solutions
         self.max_slots = max_slots
         self.max_channels = max_channels
         self.max_retries = max_retries
+        self.search = search
+        self.portfolio = PORTFOLIO if portfolio else None
+        self.cache = ScheduleCache(cache, cache_size) if cache else None
+        self.solution_file = solution_file
+        self.simulator = None
         self.network = NetworkTopology()
-        self.tsch_solver = UWBTSCHSolver(self.network, max_solutions, self.max_slots, self.max_channels, self.max_retries)
+        self.tsch_solver = UWBTSCHSolver(self.network, max_solutions, self.max_slots, self.max_channels, self.max_retries, self.search, self.portfolio, cache=self.cache, warm_start=warm_start, decompose=decompose, cell_jobs=cell_jobs, symmetry_breaking=symmetry_breaking, encoding=encoding, two_phase=two_phase, time_budget=time_budget, enumeration=enumeration, projection=projection, sample_factor=sample_factor, profiler=Profiler(profile, trace_memory), objective=objective)
 
     def setup_network_topology(self, input_file):
+        # Topology building is timed by the solver profiler (reported in logs.json)
+        with self.tsch_solver.profiler.timer("topology"):
+            self.load_network_topology(input_file)
+
+    def load_network_topology(self, input_file):
         cells = read_from_json(input_file)
+        tag_rates = {}
+        edge_rates = {}
 
-        for _, cell_value in cells.items():
+        for cell_name, cell_value in cells.items():
             tags = cell_value.get("tags", [])
             anchors = cell_value.get("anchors", [])
             parent =  cell_value.get("parent", "")
             next_parent =  cell_value.get("next_parent", "")
+            # Optional rates (cells per slotframe) of tags and edges, 1 by default
+            tag_rates.update(cell_value.get("rates", {}))
+            for node1, node2, rate in cell_value.get("edge_rates", []):
+                edge_rates[(node1, node2)] = rate
 
-            # Initialize nodes
-            tag_nodes = [ Tag(tag) for tag in tags ]
-            anchors_nodes = [ Anchor(anchors) for anchors in anchors ]
-
-            # Add nodes to network topology
+            # Initialize nodes, nodes shared with previous cells are taken from the network topology
+            tag_nodes = [ self.get_node(tag, Tag) for tag in tags ]
+            anchors_nodes = [ self.get_node(anchor, Anchor) for anchor in anchors ]
             nodes = anchors_nodes + tag_nodes
+
+            # Set parent node (shared nodes keep the parent given by the first cell declaring them)
+            parent_node = self.network.find_node_by_name(parent)
+            next_parent_node = self.network.find_node_by_name(next_parent)
             for node in nodes:
-                found = self.network.find_node_by_name(node.name)
-                if found is None:
-                    self.network.add_node(node)
-            
-            # Set parent node
-            for node in nodes:
-                parent_node = self.network.find_node_by_name(parent)
-                next_parent_node = self.network.find_node_by_name(next_parent)
+                if node.get_parent() is not None:
+                    continue
                 if node == parent_node:
                     node.set_parent(next_parent_node)
                 else:
@@ -50,24 +68,40 @@ class Main:
             # Add ranging communications
             for tag_node in tag_nodes:
                 for anchor_node in anchors_nodes:
-                    self.network.add_edges(tag_node, anchor_node)
+                    self.network.add_edges(tag_node, anchor_node, cell_name)
 
-            # Add forwarding communications
-            self.setup_forwarding_tree()
+        # Add forwarding communications once all cells are loaded
+        self.network.setup_forwarding_tree()
 
-    def traverse_node_tree(self, node, root):
-        if node.is_anchor() and node.name != root:
-            self.network.add_edges(node, node.parent)
-            self.traverse_node_tree(node.parent, root)
+        # Repeat edges required more than once per slotframe
+        self.network.set_rates(tag_rates, edge_rates)
 
-    def setup_forwarding_tree(self):
-        root = "a1"
-        for node in self.network.get_nodes():
-            if node.is_anchor() and node.name != root:
-                self.traverse_node_tree(node, root)
+    def get_node(self, name, node_type):
+        node = self.network.find_node_by_name(name)
+        if node is None:
+            node = node_type(name)
+            self.network.add_node(node)
+        return node
 
     def run_tsch_algorithm(self):
-        self.tsch_solver.run_solver()
+        return self.run_streamed(self.solution_file, self.tsch_solver.run_solver)
+
+    def run_reschedule(self, slotframe, delta, output_path):
+        # Solutions of the repair are streamed to a new file in output_path (the first sink is closed)
+        solution_file = os.path.join(output_path, os.path.basename(self.solution_file)) if self.solution_file else None
+        return self.run_streamed(solution_file, self.tsch_solver.reschedule, slotframe, delta)
+
+    def run_streamed(self, solution_file, run, *args):
+        if solution_file is None:
+            return run(*args)
+
+        # Stream solutions to the solution file as they are found
+        os.makedirs(os.path.dirname(solution_file) or ".", exist_ok=True)
+        self.tsch_solver.solution_sink = JsonLinesWriter(solution_file)
+        try:
+            return run(*args)
+        finally:
+            self.tsch_solver.solution_sink.close()
 
     def select_random_slotframe(self):
         solutions = self.tsch_solver.get_solutions()
@@ -75,34 +109,23 @@ class Main:
         return solutions[n]
 
     def register_slotframe(self, slotframe):
-        for edge, timeslot, channel in zip(self.network.get_edges(), slotframe.get_timeslot(), slotframe.get_channel()):
-            edge.set_cell(timeslot, channel)
+        # The slotframe repeats after its last used timeslot, not after the solver bound
+        used_slots, used_channels = slotframe.get_slotframe_size()
+        self.simulator = TSCHSimulator(self.network, used_slots + 1, nb_channels=used_channels + 1)
+        self.simulator.register_slotframe(slotframe)
 
-    def simulate_UWB_TSCH(self):
-        timeslot_duration = 0.5
-        results = self.tsch_solver.get_result_summary()
-        slotframe_length = int(results['nb_slots']) + 1
-        asn = 0
-        while True:
-            for timeslot in range(slotframe_length):
-                print(f"--- Timeslot {timeslot} (ASN {asn}) ---")
-                for edge in self.network.get_edges():
-                    node1, node2 = edge.get_node1(), edge.get_node2()
-                    edge_timeslot, edge_channel = edge.get_cell()['timeslot'], edge.get_cell()['channel']
-                    if edge_timeslot == timeslot :
-                        if edge.is_cap():
-                            payload = f"CAP_{node1}"
-                        if edge.is_ranging():
-                            payload = f"ToA_{node1}"
-                        if edge.is_forwarding():
-                            payload = f"Measurement_{node1}"
-                        transmission = node1.exchange(node2, payload)
-                        print(f"{edge}: {transmission} on ts={edge_timeslot}, ch={edge_channel}")
-                        # print(node2.get_queue())
-                    time.sleep(timeslot_duration)
-                asn += 1
+    def simulate_UWB_TSCH(self, nb_slotframes=None, realtime=False):
+        # Run registered slotframe for nb_slotframes (until interrupted if None), printing transmissions in real time mode
+        return self.simulator.run(nb_slotframes, realtime=realtime, verbose=realtime)
 
-    def output_communications(self, path):
+    def output_metrics(self, path):
+        # Export simulation metrics as JSON and one CSV file per table
+        metrics = self.simulator.get_metrics()
+        write_to_json(metrics.to_dict(), f"{path}/metrics.json")
+        for name, header, rows in metrics.to_rows():
+            write_to_csv(header, rows, f"{path}/metrics_{name}.csv")
+
+    def get_communications_text(self):
         edges = self.network.get_edges()
         header = "+-------------------------------+\n" + "| Network communications        |\n" + "+-------------------------------+"
         data = header
@@ -112,21 +135,89 @@ class Main:
             if communication.is_forwarding():
                 data = data + f"\nFOR {communication} | {communication.get_node1()} -> {communication.get_node2()}"
         # print(data)
-        write_to_text(data, f"{path}/communications.txt")
+        return data
 
-    def output_slotframe(self, slotframe, path):
+    def output_communications(self, path):
+        write_to_text(self.get_communications_text(), f"{path}/communications.txt")
+
+    def get_slotframe_text(self, slotframe):
         table = slotframe.show_as_table(self.network.get_edges(), self.network.get_communication())
         header = "+-------------------------------+\n" + "| Slotframe                     |\n" + "+-------------------------------+"
         data = header + "\n" + str(table)
         # print(data)
-        write_to_text(data,  f"{path}/slotframe.txt")
+        return data
+
+    def output_slotframe(self, slotframe, path):
+        write_to_text(self.get_slotframe_text(slotframe),  f"{path}/slotframe.txt")
 
     def output_logs(self, topology, path, logs={}):
         results = self.tsch_solver.get_result_summary()
-        solutions = results["solutions"]
         logs[topology] = results
         write_to_json(logs, f"{path}/logs.json")
-        write_to_json(solutions, f"{path}/solutions.json")
+        # Streamed solutions are already on disk (referenced by solutions_file)
+        if "solutions" in results:
+            write_to_json(results["solutions"], f"{path}/solutions.json")
+
+
+def schedule_topology(topology_file, options):
+    # Run scheduling algorithm for one topology and return serializable outputs
+    if options.get('solution_file'):
+        topology = os.path.splitext(os.path.basename(topology_file))[0]
+        options = dict(options, solution_file=options['solution_file'].format(topology=topology))
+    main = Main(**options)
+    main.setup_network_topology(topology_file)
+    main.run_tsch_algorithm()
+    results = main.tsch_solver.get_result_summary()
+    slotframe_text = None
+    if main.tsch_solver.get_solutions():
+        slotframe_text = main.get_slotframe_text(main.select_random_slotframe())
+    return {
+        'results': results,
+        'communications': main.get_communications_text(),
+        'slotframe': slotframe_text,
+    }
+
+def run_topology_worker(topology_file, options, connection):
+    # Report outcome to the batch process, failures included
+    try:
+        connection.send(("done", schedule_topology(topology_file, options)))
+    except Exception as error:
+        connection.send(("failed", f"{type(error).__name__}: {error}"))
+    connection.close()
+
+def run_batch(topology_files, options, jobs, timeout=None):
+    # Schedule topology files in worker processes (at most jobs at a time), a worker exceeding timeout is terminated
+    pending = list(topology_files)
+    running = {}
+    outcomes = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            topology_file = pending.pop(0)
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=run_topology_worker, args=(topology_file, options, sender))
+            process.start()
+            sender.close()
+            running[receiver] = (topology_file, process, time.time())
+
+        for receiver in wait(list(running), timeout=0.1):
+            topology_file, process, _ = running.pop(receiver)
+            try:
+                outcomes[topology_file] = receiver.recv()
+            except EOFError:
+                process.join()
+                outcomes[topology_file] = ("failed", f"Worker exited with code {process.exitcode}")
+            process.join()
+
+        if timeout is not None:
+            for receiver, (topology_file, process, start_time) in list(running.items()):
+                if time.time() - start_time > timeout:
+                    process.terminate()
+                    process.join()
+                    del running[receiver]
+                    outcomes[topology_file] = ("timeout", f"No result after {timeout} seconds")
+
+    # Merge outcomes in input order so that outputs do not depend on completion order
+    return [ (topology_file, *outcomes[topology_file]) for topology_file in topology_files ]
 
 
 if __name__ == "__main__":
@@ -137,8 +228,35 @@ if __name__ == "__main__":
     parser.add_argument("--max_slots", type=int, default=4, help="")
     parser.add_argument("--max_channels", type=int, default=1, help="")
     parser.add_argument("--max_retries", type=int, default=10, help="")
+    parser.add_argument("--objective", type=str, default="sum", choices=list(OBJECTIVES), help="minimize the sum of timeslots (sum), the largest timeslot used (makespan), or the makespan then the sum (makespan_sum)")
+    parser.add_argument("--enumeration", type=str, default="optimize", choices=["optimize", "fixed"], help="find each solution with the optimizer (optimize) or fix the optimal objective and enumerate with a plain solver (fixed)")
+    parser.add_argument("--projection", type=str, default="full", choices=["full", "timeslots"], help="solutions differ in timeslots or channels (full) or in timeslots only (timeslots)")
+    parser.add_argument("--sample_factor", type=int, default=1, help="with --enumeration=fixed, enumerate SAMPLE_FACTOR times more solutions and keep the most different ones")
+    parser.add_argument("--stream", action='store_true', help="write solutions to solutions_TOPOLOGY.jsonl as they are found instead of keeping them in memory")
+    parser.add_argument("--search", type=str, default="linear", choices=["linear", "binary", "greedy"], help="grow slotframe one by one (linear), by doubling then bisecting slots and channels (binary) or use the greedy scheduler only (greedy)")
+    parser.add_argument("--warm_start", action='store_true', help="bound the solver search with a greedy slotframe")
+    parser.add_argument("--encoding", type=str, default="auto", choices=["auto"] + ENCODINGS, help="encode timeslots and channels as integers or bit-vectors (auto selects by number of edges)")
+    parser.add_argument("--two_phase", action='store_true', help="solve timeslots only, then assign channels by coloring the edges of each timeslot")
+    parser.add_argument("--symmetry_breaking", action='store_true', help="add channel ordering and tag ordering constraints to prune equivalent schedules")
+    parser.add_argument("--decompose", action='store_true', help="solve ranging edges of each cell independently, then coordinate cells and forwarding edges")
+    parser.add_argument("--cell_jobs", type=int, default=1, help="number of worker processes used to solve cells in parallel with --decompose")
+    parser.add_argument("--portfolio", action='store_true', help="race several solver configurations in parallel and keep the first valid slotframe")
+    parser.add_argument("--cache", type=str, default=None, help="reuse schedules of unchanged topologies stored in the specified folder")
+    parser.add_argument("--cache_size", type=int, default=1000, help="maximum number of schedules kept in cache")
+    parser.add_argument("--time_budget", type=float, default=None, help="maximum solving time in seconds per topology, the best slotframe found so far is returned")
+    parser.add_argument("--profile", action='store_true', help="profile solver functions with cProfile and report the slowest ones in logs.json")
+    parser.add_argument("--trace_memory", action='store_true', help="trace the peak Python memory of the solver with tracemalloc")
+    parser.add_argument("--jobs", type=int, default=1, help="number of worker processes used to schedule topology files in parallel")
+    parser.add_argument("--timeout", type=float, default=None, help="maximum time in seconds per topology file, requires --jobs greater than 1")
+    parser.add_argument("--delta", type=str, default=None, help="apply the topology change of the specified file and repair the selected slotframe (outputs in out/TOPOLOGY/delta)")
     parser.add_argument("--watch", action='store_true', help="run with UWB-TSCH network simulation")
+    parser.add_argument("--slotframes", type=int, default=None, help="number of slotframes simulated with --watch (until interrupted by default)")
+    parser.add_argument("--metrics", action='store_true', help="export simulation metrics (queue depths, latency, utilisation, deliveries) as JSON and CSV")
+    parser.add_argument("--realtime", action='store_true', help="pace the simulation with the timeslot duration and print every transmission")
     args = parser.parse_args()
+    if args.timeout is not None and args.jobs <= 1:
+        # Topology files are only stopped by the batch workers, use --time_budget in a sequential run
+        parser.error("--timeout requires --jobs greater than 1 (use --time_budget for a sequential run)")
 
     # Get topology file
     if args.topology:
@@ -151,42 +269,120 @@ if __name__ == "__main__":
             print("File provided was not found.")
             raise SystemExit("Please enter a valid topology...")
     
-    # Trigger algorithm execution
-    for topology_file in topology_files:
-        print(f"Running scheduling algorithm for topology: {topology_file}")
-        print(f"Initial configuration: max_solutions={args.max_solutions}, max_slots={args.max_slots}, max_channels={args.max_channels}, max_retries={args.max_retries}")
+    options = {
+        'max_solutions': args.max_solutions,
+        'max_slots': args.max_slots,
+        'max_channels': args.max_channels,
+        'max_retries': args.max_retries,
+        'search': args.search,
+        'portfolio': args.portfolio,
+        'cache': args.cache,
+        'cache_size': args.cache_size,
+        'warm_start': args.warm_start,
+        'decompose': args.decompose,
+        'cell_jobs': args.cell_jobs,
+        'symmetry_breaking': args.symmetry_breaking,
+        'encoding': args.encoding,
+        'two_phase': args.two_phase,
+        'time_budget': args.time_budget,
+        'enumeration': args.enumeration,
+        'projection': args.projection,
+        'sample_factor': args.sample_factor,
+        'solution_file': None,
+        'profile': args.profile,
+        'trace_memory': args.trace_memory,
+        'objective': args.objective,
+    }
 
-        # Initialize network and solver parameters
-        main = Main(max_solutions=args.max_solutions, max_slots=args.max_slots, max_channels=args.max_channels, max_retries=args.max_retries)
-        network = main.network
-        tsch_solver = main.tsch_solver
+    # Trigger algorithm execution in parallel batch mode
+    if args.jobs > 1:
+        print(f"Running scheduling algorithm for {len(topology_files)} topologies with {args.jobs} jobs")
+        print(f"Initial configuration: {options}")
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+        if args.stream:
+            # One solution file per topology file, as workers run concurrently
+            options['solution_file'] = os.path.join(output_path, "solutions_{topology}.jsonl")
+        logs = {}
+        last_outputs = None
+        for topology_file, status, payload in run_batch(topology_files, options, args.jobs, args.timeout):
+            file = os.path.basename(topology_file)
+            if status == "done":
+                logs[file] = payload['results']
+                last_outputs = payload
+                print(f"{file}: {payload['results'].get('nb_solutions')} solution(s) in {payload['results'].get('processing_time')} seconds")
+            else:
+                logs[file] = {'status': status, 'error': payload}
+                print(f"{file}: {status} ({payload})")
+        write_to_json(logs, f"{output_path}/logs.json")
+        if last_outputs is not None:
+            if 'solutions' in last_outputs['results']:
+                write_to_json(last_outputs['results']['solutions'], f"{output_path}/solutions.json")
+            write_to_text(last_outputs['communications'], f"{output_path}/communications.txt")
+            if last_outputs['slotframe'] is not None:
+                write_to_text(last_outputs['slotframe'], f"{output_path}/slotframe.txt")
+    else:
+        # Trigger algorithm execution, one topology file after the other
+        for topology_file in topology_files:
+            print(f"Running scheduling algorithm for topology: {topology_file}")
+            print(f"Initial configuration: max_solutions={args.max_solutions}, max_slots={args.max_slots}, max_channels={args.max_channels}, max_retries={args.max_retries}, search={args.search}, portfolio={args.portfolio}")
 
-        # Setup network topology and forwarding tree
-        main.setup_network_topology(topology_file)
+            # Initialize network and solver parameters
+            if args.stream:
+                # One solution file per topology file, as in batch mode (a later topology would overwrite it)
+                topology = os.path.splitext(os.path.basename(topology_file))[0]
+                options['solution_file'] = os.path.join(output_path, f"solutions_{topology}.jsonl")
+            main = Main(**options)
+            network = main.network
+            tsch_solver = main.tsch_solver
 
-        # Trigger TSCH algorithm and show solutions
-        main.run_tsch_algorithm()
+            # Setup network topology and forwarding tree
+            main.setup_network_topology(topology_file)
 
-        # Export logs
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-        file = os.path.basename(topology_file)
-        main.output_logs(file, output_path)
+            # Trigger TSCH algorithm and show solutions
+            main.run_tsch_algorithm()
 
-        # Select slotframe
-        slotframe = main.select_random_slotframe()
-        print(f"""Random solution found: {{"timeslot": {slotframe.get_timeslot_to_string()}, "channel": {slotframe.get_channel_to_string()}}}""")
+            # Export logs
+            if not os.path.exists(output_path):
+                os.makedirs(output_path)
+            file = os.path.basename(topology_file)
+            main.output_logs(file, output_path)
 
-        # Export topology and slotframe
-        main.output_communications(output_path)
-        main.output_slotframe(slotframe, output_path)
+            # Select slotframe
+            slotframe = main.select_random_slotframe()
+            print(f"""Random solution found: {{"timeslot": {slotframe.get_timeslot_to_string()}, "channel": {slotframe.get_channel_to_string()}}}""")
 
-        # Control network over selected slotframe
-        if args.watch:
-            print(f"*** Starting network simulation")
-            try:
-                while True:
-                    main.register_slotframe(slotframe)
-                    main.simulate_UWB_TSCH()
-            except KeyboardInterrupt:
-                print("\n*** End of simulation")
\ No newline at end of file
+            # Export topology and slotframe
+            main.output_communications(output_path)
+            main.output_slotframe(slotframe, output_path)
+
+            # Repair selected slotframe after a topology change, the repaired slotframe is simulated
+            if args.delta:
+                print(f"*** Applying topology change: {args.delta}")
+                delta_path = os.path.join(output_path, "delta")
+                if not os.path.exists(delta_path):
+                    os.makedirs(delta_path)
+                found = main.run_reschedule(slotframe, read_from_json(args.delta), delta_path)
+                main.output_logs(file, delta_path, {})
+                main.output_communications(delta_path)
+                if found:
+                    slotframe = main.select_random_slotframe()
+                    print(f"""Repaired solution found: {{"timeslot": {slotframe.get_timeslot_to_string()}, "channel": {slotframe.get_channel_to_string()}}}""")
+                    main.output_slotframe(slotframe, delta_path)
+                else:
+                    # The previous slotframe is not valid for the changed topology
+                    print(f"No slotframe found after the topology change")
+                    continue
+
+            # Control network over selected slotframe
+            if args.watch:
+                print(f"*** Starting network simulation")
+                main.register_slotframe(slotframe)
+                try:
+                    main.simulate_UWB_TSCH(args.slotframes, args.realtime)
+                except KeyboardInterrupt:
+                    print("")
+                print(f"Simulation summary: {main.simulator.get_summary()}")
+                if args.metrics:
+                    main.output_metrics(output_path)
+                print("*** End of simulation")
\ No newline at end of file
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+
+from scheduling.schedule import MODEL_VERSION
+
+class ScheduleCache:
+    def __init__(self, path, max_entries=1000, model_version=MODEL_VERSION):
+        self.path = path
+        self.max_entries = max_entries
+        self.model_version = model_version
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.check_version()
+
+    def check_version(self):
+        # Invalidate all entries when the constraint model version changes
+        version_file = os.path.join(self.path, "VERSION")
+        version = None
+        if os.path.exists(version_file):
+            with open(version_file, 'r') as file:
+                version = file.read().strip()
+        if version != str(self.model_version):
+            self.clear()
+            with open(version_file, 'w') as file:
+                file.write(str(self.model_version))
+
+    def get_topology_key(self, network):
+        # Canonical description of the topology: nodes with their parent and ordered edge list
+        nodes = sorted(
+            (node.name, type(node).__name__, node.get_parent().name if node.get_parent() else None)
+            for node in network.get_nodes()
+        )
+        edges = [ (type(edge).__name__, edge.get_node1().name, edge.get_node2().name) for edge in network.get_edges() ]
+        return {'nodes': nodes, 'edges': edges}
+
+    def get_key(self, network, parameters):
+        data = {
+            'model_version': self.model_version,
+            'topology': self.get_topology_key(network),
+            'parameters': parameters,
+        }
+        encoded = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def get_entry_file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def get_entries(self):
+        return [ os.path.join(self.path, file) for file in os.listdir(self.path) if file.endswith(".json") ]
+
+    def get(self, key):
+        entry_file = self.get_entry_file(key)
+        try:
+            with open(entry_file, 'r') as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get('model_version') != self.model_version:
+            self.remove(entry_file)
+            return None
+        # Mark entry as recently used
+        os.utime(entry_file)
+        return entry['result_summary']
+
+    def put(self, key, result_summary):
+        entry = {'model_version': self.model_version, 'result_summary': result_summary}
+        entry_file = self.get_entry_file(key)
+        # Write to a temporary file first so that concurrent readers never see partial entries
+        temporary_file = f"{entry_file}.{os.getpid()}.tmp"
+        with open(temporary_file, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temporary_file, entry_file)
+        self.evict()
+
+    def evict(self):
+        # Remove least recently used entries above max_entries
+        entries = []
+        for entry_file in self.get_entries():
+            try:
+                entries.append((os.path.getmtime(entry_file), entry_file))
+            except FileNotFoundError:
+                continue
+        entries.sort(reverse=True)
+        for _, entry_file in entries[self.max_entries:]:
+            self.remove(entry_file)
+
+    def remove(self, entry_file):
+        try:
+            os.remove(entry_file)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for entry_file in self.get_entries():
+            self.remove(entry_file)
@@ -1,9 +1,24 @@
+class Payload:
+    # Data carried over a communication, timestamped with the ASN at which it was produced
+    __slots__ = ('kind', 'source', 'asn')
+
+    def __init__(self, kind, source, asn):
+        self.kind = kind
+        self.source = source
+        self.asn = asn
+
+    def __str__(self):
+        return f"{self.kind}_{self.source}"
+
 class UWBCommunication:
     def __init__(self, node1, node2, name):
         self.node1 = node1
         self.node2 = node2
         self.name = name
         self.assigned_cell = {}
+        # Cells required per slotframe (hyperperiod) and index of this cell among them
+        self.rate = 1
+        self.occurrence = 0
 
     def __str__(self):
         return self.name
@@ -26,6 +41,20 @@ class UWBCommunication:
     def is_forwarding(self):
         return False
     
+    def set_occurrence(self, occurrence, rate):
+        self.occurrence = occurrence
+        self.rate = rate
+
+    def get_occurrence(self):
+        return self.occurrence
+
+    def get_rate(self):
+        return self.rate
+
+    def get_forwarding_occurrence(self, rate):
+        # Occurrence of a next edge with the given rate forwarding this occurrence: the last one of its period
+        return max((self.occurrence + 1) * rate // self.rate - 1, 0)
+
     def set_cell(self, timeslot, channel):
         self.assigned_cell = {'timeslot' : timeslot, 'channel': channel}
     
@@ -0,0 +1,271 @@
+import time
+from multiprocessing import Pool
+from z3 import AtMost, Implies, Int, Optimize, Or, Sum, sat, unknown
+from scheduling.heuristic import ChannelColoring
+from scheduling.profiler import Profiler
+from scheduling.schedule import OBJECTIVES, get_model_values, set_solver_timeout
+from scheduling.slotframe import Slotframe
+
+def solve_cell(cell_name, subnetwork, max_slots, max_channels, max_retries, search, objective="sum", symmetry_breaking=False, encoding="int", two_phase=False, time_budget=None):
+    # Schedule the ranging edges of one cell on their own (local timeslots and channels)
+    # Imported here since the solver module depends on this one
+    from scheduling.solver import UWBTSCHSolver
+    tsch_solver = UWBTSCHSolver(subnetwork, 1, max_slots, max_channels, max_retries, search, symmetry_breaking=symmetry_breaking, encoding=encoding, two_phase=two_phase, time_budget=time_budget, objective=objective)
+    tsch_solver.run_solver()
+    solutions = tsch_solver.get_solutions()
+    # z3 statistics of the cell solvers, reported with the ones of the decomposition
+    statistics = tsch_solver.get_result_summary().get('profile', {}).get('statistics', {})
+    if not solutions:
+        return cell_name, None, tsch_solver.timed_out, statistics
+    return cell_name, (solutions[0].get_timeslot_to_string(), solutions[0].get_channel_to_string()), tsch_solver.timed_out, statistics
+
+class CellDecomposition:
+    def __init__(self, network, max_slots, max_channels, max_retries, search="linear", jobs=1, objective="sum", symmetry_breaking=False, encoding="int", two_phase=False, deadline=None, profiler=None):
+        self.network = network
+        self.max_slots = max_slots
+        self.max_channels = max_channels
+        self.max_retries = max_retries
+        self.search = search
+        self.jobs = jobs
+        self.objective = objective
+        # Options of the cell solves, the coordination model only holds a few integer offsets and forwarding edges
+        self.symmetry_breaking = symmetry_breaking
+        self.encoding = encoding
+        self.two_phase = two_phase
+        # Time budget shared by the cell solves and the coordination (absolute time, None without budget)
+        self.deadline = deadline
+        self.timed_out = False
+        self.profiler = profiler or Profiler()
+        self.cell_solutions = {}
+        self.cell_timeouts = set()
+        self.coordination_constraints = []
+
+    def get_remaining_time(self):
+        # Seconds left in the time budget, None without budget
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0)
+
+    def solve_cells(self):
+        # Solve every cell independently, in parallel when jobs > 1 (each cell solve gets the remaining time budget)
+        cell_edges = self.network.get_cell_edges()
+        time_budget = self.get_remaining_time()
+        tasks = [
+            (cell_name, self.network.get_subnetwork(edges), self.max_slots, self.max_channels, self.max_retries, self.search, self.objective, self.symmetry_breaking, self.encoding, self.two_phase, time_budget)
+            for cell_name, edges in cell_edges.items() if edges
+        ]
+        if self.jobs > 1 and len(tasks) > 1:
+            with Pool(min(self.jobs, len(tasks))) as pool:
+                results = pool.starmap(solve_cell, tasks)
+        else:
+            results = [ solve_cell(*task) for task in tasks ]
+
+        for cell_name, cell_solution, timed_out, statistics in results:
+            for solver_name, solver_statistics in statistics.items():
+                self.profiler.merge_statistics(f"cell_{solver_name}", solver_statistics)
+            if timed_out:
+                # Local schedule cut short by the time budget (best so far, or greedy)
+                self.cell_timeouts.add(cell_name)
+                self.timed_out = True
+            if cell_solution is None:
+                print(f"No local schedule found for {cell_name}")
+                return False
+            self.cell_solutions[cell_name] = cell_solution
+        return True
+
+    def get_cell_summary(self):
+        return {
+            cell_name: {
+                'nb_edges': len(timeslots),
+                'nb_slots': max(timeslots),
+                'nb_channels': max(channels),
+                'timed_out': cell_name in self.cell_timeouts,
+            }
+            for cell_name, (timeslots, channels) in self.cell_solutions.items()
+        }
+
+    def get_positions(self):
+        # (cell name, local timeslot, local channel) of each edge scheduled in a cell, None for the other edges
+        # Occurrences of repeated edges stay free, their windows depend on the global slotframe length
+        graph = self.network.get_conflict_graph()
+        positions = [ None ] * len(self.network.get_edges())
+        for cell_name, (local_timeslots, local_channels) in self.cell_solutions.items():
+            for edge, local_timeslot, local_channel in zip(self.network.get_cell_edges()[cell_name], local_timeslots, local_channels):
+                if edge.get_rate() == 1:
+                    positions[graph.get_index(edge.name)] = (cell_name, local_timeslot, local_channel)
+        return positions
+
+    def get_cell_extents(self, positions):
+        # Largest local timeslot and channel of the edges placed with each cell
+        extents = {}
+        for position in positions:
+            if position is not None:
+                cell_name, local_timeslot, local_channel = position
+                max_timeslot, max_channel = extents.get(cell_name, (0, 0))
+                extents[cell_name] = (max(max_timeslot, local_timeslot), max(max_channel, local_channel))
+        return extents
+
+    def get_coordination_variables(self, positions):
+        # Cell edges are their local cell shifted by the cell offsets, other (forwarding) edges are free
+        cell_names = { position[0] for position in positions if position is not None }
+        timeslot_offsets = { cell_name: Int(f"{cell_name}_timeslot_offset") for cell_name in sorted(cell_names) }
+        channel_offsets = { cell_name: Int(f"{cell_name}_channel_offset") for cell_name in sorted(cell_names) }
+        timeslots, channels, free_variables = [], [], []
+        for edge, position in zip(self.network.get_edges(), positions):
+            if position is None:
+                timeslot, channel = Int(f"{edge}_timeslot"), Int(f"{edge}_channel")
+                free_variables.append((timeslot, channel))
+            else:
+                cell_name, local_timeslot, local_channel = position
+                timeslot = timeslot_offsets[cell_name] + local_timeslot
+                channel = channel_offsets[cell_name] + local_channel
+            timeslots.append(timeslot)
+            channels.append(channel)
+        return timeslot_offsets, channel_offsets, free_variables, timeslots, channels
+
+    def get_pair_key(self, kind, positions, i, j):
+        # Pairs of edges of two cells only depend on the offset difference of the cells, one constraint per difference
+        position_i, position_j = positions[i], positions[j]
+        if position_i is None or position_j is None:
+            return (kind, i, j)
+        (cell_i, timeslot_i, channel_i), (cell_j, timeslot_j, channel_j) = position_i, position_j
+        if kind != "before" and cell_i > cell_j:
+            (cell_i, timeslot_i, channel_i), (cell_j, timeslot_j, channel_j) = position_j, position_i
+        channel_difference = channel_j - channel_i if kind == "channel" else None
+        return (kind, cell_i, cell_j, timeslot_j - timeslot_i, channel_difference)
+
+    def get_coordination_constraints(self, positions, timeslots, channels):
+        # Constraints of the global model between edges that are not scheduled in the same cell
+        graph = self.network.get_conflict_graph()
+        pairs = [ ("before", u, v) for u, v in graph.get_dependencies() + graph.get_occurrences() ]
+        # Conflicting edges are computed once, as unordered pairs (i < j)
+        distinct = { (min(u, v), max(u, v)) for u, v in graph.get_conflicts() }
+        if self.two_phase:
+            # Channels are colored afterwards, only conflicting pairs are constrained
+            pairs += [ ("distinct", i, j) for i, j in sorted(distinct) ]
+        else:
+            for i in range(len(timeslots)):
+                for j in range(i + 1, len(timeslots)):
+                    pairs.append(("distinct" if (i, j) in distinct else "channel", i, j))
+
+        constraints = []
+        keys = set()
+        for kind, i, j in pairs:
+            if positions[i] is not None and positions[j] is not None and positions[i][0] == positions[j][0]:
+                # Solved in the cell schedule, which is only shifted
+                continue
+            key = self.get_pair_key(kind, positions, i, j)
+            if key in keys:
+                continue
+            keys.add(key)
+            if kind == "before":
+                constraints.append(timeslots[i] < timeslots[j])
+            elif kind == "distinct":
+                constraints.append(timeslots[i] != timeslots[j])
+            else:
+                constraints.append(Implies(timeslots[i] == timeslots[j], channels[i] != channels[j]))
+        return constraints
+
+    def get_domain_constraints(self, max_slots, max_channels, extents, timeslot_offsets, channel_offsets, free_variables, timeslots):
+        # Shifted cells and free edges stay in the slotframe, out of the shared timeslot 0
+        constraints = []
+        for cell_name, (max_timeslot, max_channel) in extents.items():
+            constraints.extend([
+                timeslot_offsets[cell_name] >= 0,
+                timeslot_offsets[cell_name] + max_timeslot <= max_slots,
+            ])
+            if not self.two_phase:
+                constraints.extend([
+                    channel_offsets[cell_name] >= 0,
+                    channel_offsets[cell_name] + max_channel <= max_channels,
+                ])
+        for timeslot, channel in free_variables:
+            constraints.extend([ 1 <= timeslot, timeslot <= max_slots ])
+            if not self.two_phase:
+                constraints.extend([ 0 <= channel, channel <= max_channels ])
+        if self.two_phase:
+            # Channels are colored afterwards, a timeslot holds at most MAX_CHANNELS + 1 edges
+            constraints.extend([ AtMost(*[ timeslot == slot for timeslot in timeslots ], max_channels + 1) for slot in range(1, max_slots + 1) ])
+        return constraints
+
+    def get_makespan_constraints(self, extents, timeslot_offsets, free_variables, timeslots, makespan):
+        # The makespan bounds the last timeslot of each cell and free edge
+        ends = [ timeslot_offsets[cell_name] + max_timeslot for cell_name, (max_timeslot, _) in extents.items() ]
+        ends += [ timeslot for timeslot, _ in free_variables ]
+        constraints = [ end <= makespan for end in ends ]
+        if self.network.has_repeated_edges():
+            # Occurrence k of an edge repeated r times lies in the k-th of r windows of the slotframe (see Schedule.get_occurrence_constraints)
+            for edge, timeslot in zip(self.network.get_edges(), timeslots):
+                occurrence, rate = edge.get_occurrence(), edge.get_rate()
+                if rate > 1:
+                    constraints.extend([ occurrence * makespan < rate * timeslot, rate * timeslot <= (occurrence + 1) * makespan ])
+            constraints.append(Or([ end == makespan for end in ends ]))
+        return constraints
+
+    def get_objectives(self, timeslots, makespan):
+        # Objective terms of the schedule, minimized in lexicographic order
+        terms = {'sum': Sum(timeslots), 'makespan': makespan}
+        return [ terms[name] for name in OBJECTIVES[self.objective] ]
+
+    def coordinate(self, max_slots, max_channels, max_solutions):
+        # Place cells (by offsets) and forwarding edges in the global slotframe
+        positions = self.get_positions()
+        extents = self.get_cell_extents(positions)
+        timeslot_offsets, channel_offsets, free_variables, timeslots, channels = self.get_coordination_variables(positions)
+        makespan = Int("makespan")
+        objectives = self.get_objectives(timeslots, makespan)
+        constraints = self.get_coordination_constraints(positions, timeslots, channels) + \
+            self.get_domain_constraints(max_slots, max_channels, extents, timeslot_offsets, channel_offsets, free_variables, timeslots)
+        if "makespan" in OBJECTIVES[self.objective] or self.network.has_repeated_edges():
+            constraints += self.get_makespan_constraints(extents, timeslot_offsets, free_variables, timeslots, makespan)
+        self.coordination_constraints = constraints
+
+        solver = Optimize()
+        set_solver_timeout(solver, self.get_remaining_time())
+        solver.add(constraints)
+        for objective in objectives:
+            solver.minimize(objective)
+
+        # Solutions differ in offsets or free edges
+        variables = list(timeslot_offsets.values()) + [ timeslot for timeslot, _ in free_variables ]
+        if not self.two_phase:
+            variables += list(channel_offsets.values()) + [ channel for _, channel in free_variables ]
+
+        solutions = []
+        while len(solutions) < max_solutions:
+            result = solver.check()
+            if result == unknown:
+                # Out of time: keep the best placement found so far by the optimizer, if any
+                self.timed_out = self.deadline is not None
+                model = self.get_best_model(solver) if not solutions else None
+                if model is None:
+                    break
+            elif result != sat:
+                break
+            else:
+                model = solver.model()
+            timeslot_values = get_model_values(model, timeslots)
+            if self.two_phase:
+                channel_values = ChannelColoring(self.network, max_channels).compute(timeslot_values)
+            else:
+                channel_values = get_model_values(model, channels)
+            if channel_values is not None:
+                slotframe = Slotframe(timeslot_values, channel_values)
+                # An interrupted model is only kept if it is a valid slotframe
+                if result == sat or not slotframe.verify_slotframe(self.network.get_edges()):
+                    solutions.append(slotframe)
+
+            # Add blocking clause to prevent finding the same solution again
+            values = get_model_values(model, variables)
+            solver.add(Or([ variable != value for variable, value in zip(variables, values) ]))
+            if result == unknown:
+                break
+        self.profiler.add_statistics("coordination_solver", solver)
+        return solutions
+
+    def get_best_model(self, solver):
+        # Model of the last improving placement found by Optimize before it was interrupted
+        try:
+            return solver.model()
+        except Exception:
+            return None
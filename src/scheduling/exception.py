@@ -13,4 +13,14 @@ class ConcurrencyException(Exception):
     def __init__(self, edgei, edgej, error):
         self.edgei = edgei
         self.edgej = edgej
-        super().__init__(f"{error}")
\ No newline at end of file
+        super().__init__(f"{error}")
+class OccurrenceException(Exception):
+    def __init__(self, edge, error):
+        self.edge = edge
+        super().__init__(f"{error}")
+
+class LengthException(Exception):
+    def __init__(self, expected, found, error):
+        self.expected = expected
+        self.found = found
+        super().__init__(f"{error}")
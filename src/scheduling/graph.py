@@ -0,0 +1,87 @@
+class ConflictGraph:
+    def __init__(self, edges):
+        self.edges = edges
+        self.edge_index = {}
+        self.senders = []
+        self.receivers = []
+        self.incident = {}
+        self.outgoing = {}
+        self.incoming = {}
+        self.build()
+
+    def build(self):
+        # Index edges and register them by sender, receiver and incident node names
+        for i, edge in enumerate(self.edges):
+            sender, receiver = edge.get_node1().name, edge.get_node2().name
+            self.edge_index[edge.name] = i
+            self.senders.append(sender)
+            self.receivers.append(receiver)
+            self.outgoing.setdefault(sender, []).append(i)
+            self.incoming.setdefault(receiver, []).append(i)
+            self.incident.setdefault(sender, set()).add(i)
+            self.incident.setdefault(receiver, set()).add(i)
+
+    def get_index(self, edge_name):
+        return self.edge_index[edge_name]
+
+    def get_outgoing(self, node_name):
+        return self.outgoing.get(node_name, [])
+
+    def get_incoming(self, node_name):
+        return self.incoming.get(node_name, [])
+
+    def get_incident(self, node_name):
+        return self.incident.get(node_name, set())
+
+    def get_neighbours(self, i):
+        # Edges sharing at least one node with edge i
+        neighbours = self.get_incident(self.senders[i]) | self.get_incident(self.receivers[i])
+        return neighbours - {i}
+
+    def is_conflicting(self, i, j):
+        return i != j and j in self.get_neighbours(i)
+
+    def get_dependencies(self):
+        # Pairs (u, v) where edge v forwards what edge u delivered to its receiver (for repeated edges, the occurrence of v closing the period of u)
+        dependencies = []
+        for u in range(len(self.edges)):
+            for v in self.get_outgoing(self.receivers[u]):
+                if self.edges[v].get_occurrence() == self.edges[u].get_forwarding_occurrence(self.edges[v].get_rate()):
+                    dependencies.append((u, v))
+        return dependencies
+
+    def get_occurrences(self):
+        # Pairs (u, v) of consecutive occurrences of a repeated edge
+        occurrences = []
+        previous = {}
+        for v, edge in enumerate(self.edges):
+            key = (self.senders[v], self.receivers[v], edge.is_ranging())
+            if edge.get_occurrence() > 0 and key in previous:
+                occurrences.append((previous[key], v))
+            previous[key] = v
+        return occurrences
+
+    def get_conflicting(self, u):
+        # Edges v where the sender of u is busy in v or both edges share a receiver
+        sender, receiver = self.senders[u], self.receivers[u]
+        conflicting = set(self.get_incoming(sender)) | set(self.get_outgoing(sender)) | set(self.get_incoming(receiver))
+        conflicting.discard(u)
+        return conflicting
+
+    def get_conflicts(self):
+        # Ordered pairs (u, v) of conflicting edges
+        conflicts = []
+        for u in range(len(self.edges)):
+            for v in sorted(self.get_conflicting(u)):
+                conflicts.append((u, v))
+        return conflicts
+
+    def get_concurrent(self):
+        # Ordered pairs (u, v) of distinct edges that are not conflicting
+        concurrent = []
+        for u in range(len(self.edges)):
+            conflicting = self.get_conflicting(u)
+            for v in range(len(self.edges)):
+                if v != u and v not in conflicting:
+                    concurrent.append((u, v))
+        return concurrent
@@ -0,0 +1,123 @@
+from scheduling.slotframe import Slotframe
+
+class GreedyScheduler:
+    def __init__(self, network, max_channels=None):
+        self.network = network
+        self.graph = network.get_conflict_graph()
+        self.max_channels = max_channels
+        self.timeslots = []
+        self.channels = []
+
+    def get_dependency_order(self):
+        # Topological order of edges over dependency pairs (ranging before forwarding) and occurrences of repeated edges, None if cyclic
+        edges = self.network.get_edges()
+        predecessors = [ [] for _ in edges ]
+        successors = [ [] for _ in edges ]
+        for u, v in self.graph.get_dependencies() + self.graph.get_occurrences():
+            predecessors[v].append(u)
+            successors[u].append(v)
+        in_degree = [ len(predecessor) for predecessor in predecessors ]
+        order = [ i for i in range(len(edges)) if in_degree[i] == 0 ]
+        for u in order:
+            for v in successors[u]:
+                in_degree[v] -= 1
+                if in_degree[v] == 0:
+                    order.append(v)
+        if len(order) < len(edges):
+            return None, predecessors
+        return order, predecessors
+
+    def compute(self):
+        # Occurrences of repeated edges lie in windows of the slotframe length: grow the length until they all fit
+        edges = self.network.get_edges()
+        if not self.network.has_repeated_edges():
+            return self.compute_length()
+        for length in range(1, len(edges) * max(edge.get_rate() for edge in edges) + 1):
+            slotframe = self.compute_length(length)
+            if slotframe is not None and self.fits_windows(max(self.timeslots)):
+                return slotframe
+        return None
+
+    def get_window(self, u, length):
+        # Timeslots t of occurrence k of an edge repeated r times such k*L < r*t <= (k+1)*L
+        edge = self.network.get_edges()[u]
+        occurrence, rate = edge.get_occurrence(), edge.get_rate()
+        return occurrence * length // rate + 1, (occurrence + 1) * length // rate
+
+    def fits_windows(self, length):
+        # Windows of the slotframe length actually used (largest timeslot)
+        for u, timeslot in enumerate(self.timeslots):
+            first, last = self.get_window(u, length)
+            if not first <= timeslot <= last:
+                return False
+        return True
+
+    def compute_length(self, length=None):
+        # List scheduling: each edge takes the earliest timeslot after its predecessors (and in its window for a given length)
+        # without conflicting edges, and the lowest channel free in that timeslot
+        edges = self.network.get_edges()
+        order, predecessors = self.get_dependency_order()
+        if order is None:
+            return None
+
+        timeslots = [ None ] * len(edges)
+        channels = [ None ] * len(edges)
+        slot_edges = {}
+        for u in order:
+            neighbours = self.graph.get_neighbours(u)
+            # Timeslot 0 is reserved for shared communications
+            timeslot = max([ timeslots[v] for v in predecessors[u] ], default=0) + 1
+            if length is not None:
+                first, last = self.get_window(u, length)
+                timeslot = max(timeslot, first)
+            while True:
+                if length is not None and timeslot > last:
+                    return None
+                scheduled = slot_edges.get(timeslot, [])
+                if not any(v in neighbours for v in scheduled):
+                    used_channels = { channels[v] for v in scheduled }
+                    channel = min(set(range(len(scheduled) + 1)) - used_channels)
+                    if self.max_channels is None or channel <= self.max_channels:
+                        break
+                timeslot += 1
+            timeslots[u], channels[u] = timeslot, channel
+            slot_edges.setdefault(timeslot, []).append(u)
+
+        self.timeslots, self.channels = timeslots, channels
+        return Slotframe(timeslots, channels)
+
+    def get_slotframe_size(self):
+        # Smallest (max_slots, max_channels) bounds containing the computed slotframe
+        return max(self.timeslots, default=1), max(self.channels, default=0)
+
+
+class ChannelColoring:
+    def __init__(self, network, max_channels=None):
+        self.network = network
+        self.graph = network.get_conflict_graph()
+        self.max_channels = max_channels
+        self.channels = []
+
+    def get_slot_edges(self, timeslots):
+        slot_edges = {}
+        for i, timeslot in enumerate(timeslots):
+            slot_edges.setdefault(timeslot, []).append(i)
+        return slot_edges
+
+    def compute(self, timeslots):
+        # Color the edges of each timeslot: edges sharing a timeslot must use distinct channels
+        # Edges are colored by decreasing number of conflicting edges, each taking the lowest free channel
+        channels = [ None ] * len(timeslots)
+        for scheduled in self.get_slot_edges(timeslots).values():
+            order = sorted(scheduled, key=lambda u: (-len(self.graph.get_neighbours(u)), u))
+            for u in order:
+                used_channels = { channels[v] for v in scheduled if channels[v] is not None }
+                channel = min(set(range(len(scheduled))) - used_channels)
+                if self.max_channels is not None and channel > self.max_channels:
+                    return None
+                channels[u] = channel
+        self.channels = channels
+        return channels
+
+    def get_nb_channels(self):
+        return max(self.channels, default=0)
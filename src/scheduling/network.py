@@ -1,25 +1,45 @@
 from scheduling.communication import UWBCommunication, Ranging, Forwarding
-from scheduling.node import Node
+from scheduling.graph import ConflictGraph
+from scheduling.node import Node, Tag, Anchor
 
 class NetworkTopology:
     def __init__(self):
         self.nodes = []
         self.edges = []
+        # Lookups by node name and by (node1 name, node2 name, kind), kept in sync with nodes and edges
+        self.node_index = {}
+        self.edge_index = {}
         self.communication = []
+        self.conflict_graph = None
+        self.edge_counter = 0
+        self.cell_edges = {}
+        # Rates given by the topology, kept to update repeated edges after a topology change
+        self.tag_rates = {}
+        self.edge_rates = {}
 
     def add_node(self, node:Node):
         self.nodes.append(node)
+        self.node_index[node.name] = node
 
     def get_nodes(self) -> list[Node]:
         return self.nodes
     
     def find_node_by_name(self, node_name:str):
-        for node in self.get_nodes():
-            if node.name == node_name:
-                return node
+        return self.node_index.get(node_name)
+
+    def get_edge_key(self, node1:Node, node2:Node):
+        kind = "ranging" if node1.is_tag() else "forwarding"
+        return (node1.name, node2.name, kind)
+
+    def add_edges(self, node1:Node, node2:Node, cell_name:str=None):
+        # An edge between the same nodes is only added once (each edge adds solver variables and constraints)
+        key = self.get_edge_key(node1, node2)
+        if key in self.edge_index:
+            return self.edge_index[key]
 
-    def add_edges(self, node1:Node, node2:Node):
-        name = f"e{len(self.get_edges())}"
+        # Edge names stay unique after removals since they name solver variables
+        name = f"e{self.edge_counter}"
+        self.edge_counter += 1
         if node1.is_tag():
             edge = Ranging(node1, node2, name)
         else:
@@ -27,9 +47,175 @@ class NetworkTopology:
         node1.set_communication(edge)
         node2.set_communication(edge)
         self.edges.append(edge)
+        self.edge_index[key] = edge
+        self.conflict_graph = None
+        if cell_name is not None:
+            self.cell_edges.setdefault(cell_name, []).append(edge)
+        return edge
 
     def get_edges(self) -> list[UWBCommunication]:
         return self.edges
+
+    def set_rates(self, tag_rates:dict, edge_rates:dict):
+        """ Repeat edges over the slotframe (hyperperiod) according to their required rate
+        :param tag_rates: dict such {"t1": 10}, rate of the ranging edges of a tag
+        :param edge_rates: dict such {("a2", "a1"): 10}, rate of an edge (overrides the tag rate)
+        """
+        self.tag_rates, self.edge_rates = dict(tag_rates), dict(edge_rates)
+        graph = self.get_conflict_graph()
+        rates = {}
+
+        def get_rate(i):
+            # Forwarding edges take the highest rate of the edges delivering to their sender
+            if i not in rates:
+                edge = self.edges[i]
+                key = (edge.get_node1().name, edge.get_node2().name)
+                if key in edge_rates:
+                    rates[i] = edge_rates[key]
+                elif edge.is_forwarding():
+                    rates[i] = max([ get_rate(j) for j in graph.get_incoming(edge.get_node1().name) ], default=1)
+                else:
+                    rates[i] = tag_rates.get(edge.get_node1().name, 1)
+            return rates[i]
+
+        for i in range(len(self.edges)):
+            # A rate is a number of occurrences, 2.5 (or 2.0 read from JSON) is rejected
+            if not isinstance(get_rate(i), int) or rates[i] < 1:
+                raise ValueError(f"Rate of edge {self.edges[i]} must be a positive integer ({rates[i]})")
+        for edge, rate in zip(list(self.edges), [ rates[i] for i in range(len(self.edges)) ]):
+            self.repeat_edge(edge, rate)
+
+    def repeat_edge(self, edge:UWBCommunication, rate:int):
+        # Occurrences are added right after the edge (and in its cell), each one is scheduled in its own cell
+        if edge.get_occurrence() > 0 or edge.get_rate() == rate:
+            return
+        # Occurrences of a previous rate are replaced
+        for occurrence in self.get_occurrences(edge):
+            if occurrence is not edge:
+                self.remove_edge(occurrence)
+        edge.set_occurrence(0, rate)
+        occurrences = []
+        for occurrence in range(1, rate):
+            repeated_edge = type(edge)(edge.get_node1(), edge.get_node2(), f"{edge.name}_{occurrence}")
+            repeated_edge.set_occurrence(occurrence, rate)
+            occurrences.append(repeated_edge)
+        index = self.edges.index(edge) + 1
+        self.edges[index:index] = occurrences
+        for edges in self.cell_edges.values():
+            if edge in edges:
+                index = edges.index(edge) + 1
+                edges[index:index] = occurrences
+        self.conflict_graph = None
+
+    def get_occurrences(self, edge:UWBCommunication):
+        # Edge and its repeated occurrences
+        return [ other for other in self.edges if other.get_nodes() == edge.get_nodes() and type(other) is type(edge) ]
+
+    def has_repeated_edges(self):
+        return any(edge.get_rate() > 1 for edge in self.edges)
+
+    def get_rates(self):
+        # Rate of each repeated edge, by name of its first occurrence
+        return { edge.name: edge.get_rate() for edge in self.edges if edge.get_rate() > 1 and edge.get_occurrence() == 0 }
+
+    def get_cell_edges(self) -> dict[str, list[UWBCommunication]]:
+        return self.cell_edges
+
+    def get_subnetwork(self, edges:list[UWBCommunication]):
+        # Topology restricted to the given edges (edges and nodes are shared, not copied)
+        subnetwork = NetworkTopology()
+        for edge in edges:
+            for node in edge.get_nodes():
+                if subnetwork.find_node_by_name(node.name) is None:
+                    subnetwork.add_node(node)
+            subnetwork.edges.append(edge)
+            subnetwork.edge_index[self.get_edge_key(*edge.get_nodes())] = edge
+        return subnetwork
+
+    def traverse_node_tree(self, node:Node, root:str):
+        # Stop at anchors already forwarding to their parent, the path above them exists
+        if node.is_anchor() and node.name != root and node.get_parent() is not None and self.find_edge(node.name, node.get_parent().name, "forwarding") is None:
+            self.add_edges(node, node.get_parent())
+            self.traverse_node_tree(node.get_parent(), root)
+
+    def setup_forwarding_tree(self, root:str="a1"):
+        # Forwarding edges from every anchor up to the root anchor
+        for node in self.get_nodes():
+            if node.is_anchor() and node.name != root:
+                self.traverse_node_tree(node, root)
+
+    def get_cell_name(self, node_name:str):
+        # Cell of the ranging edges of a tag, None if it has none
+        for cell_name, edges in self.cell_edges.items():
+            if any(edge.get_node1().name == node_name for edge in edges):
+                return cell_name
+
+    def find_edge(self, node1_name:str, node2_name:str, kind:str=None):
+        # Edge from node1 to node2, of the given kind ("ranging" or "forwarding") or of any kind
+        kinds = [kind] if kind is not None else ["ranging", "forwarding"]
+        for edge_kind in kinds:
+            edge = self.edge_index.get((node1_name, node2_name, edge_kind))
+            if edge is not None:
+                return edge
+
+    def remove_edge(self, edge:UWBCommunication):
+        self.edges.remove(edge)
+        key = self.get_edge_key(*edge.get_nodes())
+        if self.edge_index.get(key) is edge:
+            del self.edge_index[key]
+        for cell_name, edges in self.cell_edges.items():
+            if edge in edges:
+                edges.remove(edge)
+        for node in edge.get_nodes():
+            if edge in node.communications:
+                node.communications.remove(edge)
+        self.conflict_graph = None
+
+    def remove_node(self, node_name:str):
+        # Remove node and every edge it takes part in
+        for edge in list(self.get_edges()):
+            if node_name in (edge.get_node1().name, edge.get_node2().name):
+                self.remove_edge(edge)
+        self.nodes = [ node for node in self.nodes if node.name != node_name ]
+        self.node_index.pop(node_name, None)
+
+    def apply_delta(self, delta:dict):
+        """ Apply a topology change
+        :param delta: dict such {"remove_edges": [["t1", "a3"]], "remove_nodes": ["t2"],
+            "add_nodes": [{"name": "a5", "type": "anchor", "parent": "a4"}, {"name": "t3", "type": "tag"}],
+            "add_edges": [["t3", "a4", "cell3"], ["t3", "a5"]], "rates": {"t3": 2}, "edge_rates": [["t3", "a5", 3]]}
+            An added edge takes the given cell, else the cell of the ranging edges of its tag
+        """
+        for node1_name, node2_name in delta.get("remove_edges", []):
+            edge = self.find_edge(node1_name, node2_name)
+            if edge is not None:
+                for occurrence in self.get_occurrences(edge):
+                    self.remove_edge(occurrence)
+        for node_name in delta.get("remove_nodes", []):
+            self.remove_node(node_name)
+        for node_value in delta.get("add_nodes", []):
+            if self.find_node_by_name(node_value["name"]) is None:
+                node = Tag(node_value["name"]) if node_value.get("type") == "tag" else Anchor(node_value["name"])
+                node.set_parent(self.find_node_by_name(node_value.get("parent", "")))
+                self.add_node(node)
+        for edge_value in delta.get("add_edges", []):
+            node1_name, node2_name = edge_value[:2]
+            cell_name = edge_value[2] if len(edge_value) > 2 else self.get_cell_name(node1_name)
+            self.add_edges(self.find_node_by_name(node1_name), self.find_node_by_name(node2_name), cell_name)
+
+        # Added anchors forward to their parent, then rates are updated (forwarding edges follow the edges they forward)
+        self.setup_forwarding_tree()
+        tag_rates = dict(self.tag_rates, **delta.get("rates", {}))
+        edge_rates = dict(self.edge_rates)
+        for node1_name, node2_name, rate in delta.get("edge_rates", []):
+            edge_rates[(node1_name, node2_name)] = rate
+        self.set_rates(tag_rates, edge_rates)
+    
+    def get_conflict_graph(self) -> ConflictGraph:
+        # Build conflict graph once and reuse it until edges change
+        if self.conflict_graph is None:
+            self.conflict_graph = ConflictGraph(self.get_edges())
+        return self.conflict_graph
     
     def get_communication_from_node(self, node:Node):
         for n in self.get_nodes():
@@ -62,8 +62,12 @@ class Anchor(Node):
     def communicate(self, other):
         return (self.name, other.name)
     
-    def exchange(self, other, payload):
-        other.set_queue(payload)
+    def exchange(self, other, payload=None):
+        # Forward queued payloads (measurements received from tags and children) to the other node
+        if payload is not None:
+            other.set_queue(payload)
+        for queued_payload in self.queue:
+            other.set_queue(queued_payload)
         self.delete_forwarded_payload()
         return f"Forwarding between {self.name} and {other}"
     
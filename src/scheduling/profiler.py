@@ -0,0 +1,128 @@
+import cProfile
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# z3 statistics summed over solvers (the SAT engine used for bit-vectors prefixes its keys with "sat")
+Z3_COUNTERS = {
+    'conflicts': ["conflicts", "sat conflicts"],
+    'decisions': ["decisions", "sat decisions"],
+    'propagations': ["propagations", "sat propagations 2ary", "sat propagations nary"],
+}
+
+def get_solver_statistics(solver):
+    # Statistics of a z3 solver (cumulative over its checks), memory in megabytes
+    statistics = solver.statistics()
+    return { key: statistics.get_key_value(key) for key in statistics.keys() }
+
+class Profiler:
+    def __init__(self, cprofile=False, trace_memory=False, nb_functions=20):
+        self.cprofile = cprofile
+        self.trace_memory = trace_memory
+        self.nb_functions = nb_functions
+        # Seconds and number of calls per named phase, counters per name
+        self.timers = {}
+        self.calls = {}
+        self.counters = {}
+        # One record per solver call on a slotframe size (retry or probe), with its own timers and counters
+        self.retries = []
+        self.current_retry = None
+        self.statistics = {}
+        self.profile = None
+        self.memory_peak = None
+
+    @contextmanager
+    def timer(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def add_time(self, name, elapsed):
+        self.timers[name] = self.timers.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.current_retry is not None:
+            timers = self.current_retry['timers']
+            timers[name] = timers.get(name, 0.0) + elapsed
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        if self.current_retry is not None:
+            counters = self.current_retry['counters']
+            counters[name] = counters.get(name, 0) + value
+
+    def start_retry(self, **fields):
+        self.current_retry = dict(fields, timers={}, counters={})
+        self.retries.append(self.current_retry)
+
+    def end_retry(self, **fields):
+        if self.current_retry is not None:
+            self.current_retry.update(fields)
+        self.current_retry = None
+
+    def add_statistics(self, name, solver):
+        if solver is not None:
+            self.merge_statistics(name, get_solver_statistics(solver))
+
+    def merge_statistics(self, name, statistics):
+        # Statistics of solvers sharing a name (one per retry, cell or repair) are summed, memory keeps the largest value
+        merged = dict(self.statistics.get(name, {}))
+        for key, value in statistics.items():
+            if key in merged and isinstance(value, (int, float)):
+                merged[key] = max(merged[key], value) if "memory" in key else merged[key] + value
+            else:
+                merged[key] = value
+        self.statistics[name] = merged
+
+    def start(self):
+        # Optional function profiling and Python memory tracing (z3 allocations are reported by its statistics)
+        if self.cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            self.memory_peak = peak / 2**20
+            tracemalloc.stop()
+
+    def get_functions(self):
+        # Functions with the largest cumulative time
+        stats = pstats.Stats(self.profile)
+        functions = []
+        for (file, line, name), (_, nb_calls, total_time, cumulative_time, _) in stats.stats.items():
+            functions.append({
+                'function': f"{file}:{line}({name})",
+                'calls': nb_calls,
+                'total_time': total_time,
+                'cumulative_time': cumulative_time,
+            })
+        functions.sort(key=lambda function: function['cumulative_time'], reverse=True)
+        return functions[:self.nb_functions]
+
+    def get_z3_summary(self):
+        # Counters summed over solvers, largest memory reported by a solver
+        summary = { name: sum(statistics.get(key, 0) for statistics in self.statistics.values() for key in keys) for name, keys in Z3_COUNTERS.items() }
+        summary['memory'] = max([ statistics.get('max memory', statistics.get('memory', 0)) for statistics in self.statistics.values() ], default=0)
+        return summary
+
+    def get_summary(self):
+        summary = {
+            'timers': self.timers,
+            'calls': self.calls,
+            'counters': self.counters,
+            'retries': self.retries,
+            'z3': self.get_z3_summary(),
+            'statistics': self.statistics,
+        }
+        if self.profile is not None:
+            summary['functions'] = self.get_functions()
+        if self.memory_peak is not None:
+            summary['python_memory_peak'] = self.memory_peak
+        return summary
@@ -1,29 +1,118 @@
-from z3 import Int, And, Or, If
+from z3 import Int, BitVec, And, AtMost, If, Implies, Or, Sum, ZeroExt
+from scheduling.profiler import Profiler
+
+# Version of the constraint model, bump it when constraints change to invalidate cached schedules
+MODEL_VERSION = 2
+
+# Variable encodings: unbounded integers or fixed-width bit-vectors (bit-blasted to SAT)
+ENCODINGS = ["int", "bitvector"]
+
+# Objectives minimized by the solver, terms in lexicographic order: sum of timeslots, largest timeslot used (makespan)
+OBJECTIVES = {
+    'sum': ["sum"],
+    'makespan': ["makespan"],
+    'makespan_sum': ["makespan", "sum"],
+}
+
+# Encoding chosen by "auto": integers are faster on small topologies, bit-vectors from this number of edges on
+BITVECTOR_MIN_EDGES = 13
+
+def select_encoding(encoding, nb_edges):
+    if encoding == "auto":
+        return "bitvector" if nb_edges >= BITVECTOR_MIN_EDGES else "int"
+    return encoding
+
+def get_objective_values(objective, timeslots):
+    # Values of the objective terms for the timeslots of a slotframe
+    values = {'sum': sum(timeslots), 'makespan': max(timeslots, default=0)}
+    return [ values[name] for name in OBJECTIVES[objective] ]
+
+def get_model_values(model, variables):
+    # Integer values of timeslot or channel variables in a z3 model (Slotframe holds plain integers)
+    return [ model.evaluate(variable, model_completion=True).as_long() for variable in variables ]
+
+def set_solver_timeout(solver, remaining):
+    # Interrupt z3 when the time budget runs out (timeout in milliseconds, 0 would disable it)
+    if remaining is not None:
+        solver.set("timeout", max(int(remaining * 1000), 1))
 
 class Schedule:
-    def __init__(self, network, max_slots, max_channels):
+    def __init__(self, network, max_slots, max_channels, symmetry_breaking=False, encoding="int", max_value=0, two_phase=False, profiler=None, objective="sum"):
         self.network = network
         self.max_slots = max_slots
         self.max_channels = max_channels
+        self.symmetry_breaking = symmetry_breaking
+        # Two-phase mode: timeslots only, channels are assigned afterwards by coloring each timeslot
+        self.two_phase = two_phase
+        self.objective = objective
+        self.encoding = select_encoding(encoding, len(network.get_edges()))
+        # Largest timeslot or channel bound used with this schedule (sets the bit-vector width)
+        self.max_value = max(max_value, max_slots, max_channels, 1)
+        # Constraint families are timed and counted by the profiler of the solver run
+        self.profiler = profiler or Profiler()
+        self.graph = network.get_conflict_graph()
+        self.timeslots = None
+        self.channels = None
+        self.makespan = None
         
         self.default_constraints = []
         self.dependency_constraints = []
         self.conflict_constraints = []
         self.timeslot_constraints = []
         self.channel_constraints = []
+        self.symmetry_constraints = []
+        self.makespan_constraints = []
+        self.occurrence_constraints = []
         self.model_constraints = []
 
     def get_assignments(self):
         # Define variables to represent the assignment of each communication
         edges = self.network.get_edges_str()
-        assignments = [(Int(f"{edge}_timeslot"), Int(f"{edge}_channel")) for edge in edges]
+        if self.encoding == "bitvector":
+            width = self.get_bitvector_width()
+            assignments = [(BitVec(f"{edge}_timeslot", width), BitVec(f"{edge}_channel", width)) for edge in edges]
+        else:
+            assignments = [(Int(f"{edge}_timeslot"), Int(f"{edge}_channel")) for edge in edges]
         return assignments
+
+    def get_bitvector_width(self):
+        # Comparisons on bit-vectors are signed, keep one spare bit so that bounded values stay positive
+        return self.max_value.bit_length() + 1
+
+    def get_objective(self):
+        timeslots, _ = self.get_timeslots_channels()
+        if self.encoding == "bitvector":
+            # Widen timeslots so that their sum cannot overflow
+            extension = len(timeslots).bit_length() + 1
+            return Sum([ ZeroExt(extension, timeslot) for timeslot in timeslots ])
+        return Sum(timeslots)
+
+    def get_makespan(self):
+        # Upper bound of every timeslot (makespan constraints), equal to the largest timeslot once minimized
+        if self.makespan is None:
+            if self.encoding == "bitvector":
+                self.makespan = BitVec("makespan", self.get_bitvector_width())
+            else:
+                self.makespan = Int("makespan")
+        return self.makespan
+
+    def uses_makespan(self):
+        return "makespan" in OBJECTIVES[self.objective]
+
+    def get_objectives(self):
+        # Terms of the objective, minimized in lexicographic order
+        terms = {'sum': self.get_objective, 'makespan': self.get_makespan}
+        return [ terms[name]() for name in OBJECTIVES[self.objective] ]
+
+    def get_objective_values(self, timeslots):
+        return get_objective_values(self.objective, timeslots)
     
     def get_timeslots_channels(self):
-        # Unpack assignments into separate lists for timeslots and channels
-        assignments = self.get_assignments()
-        timeslots, channels = zip(*assignments)
-        return timeslots, channels
+        # Unpack assignments into separate lists for timeslots and channels (created once per schedule)
+        if self.timeslots is None:
+            assignments = self.get_assignments()
+            self.timeslots, self.channels = zip(*assignments)
+        return self.timeslots, self.channels
     
     def add_constraint(self, constraint):
         self.model_constraints.extend(constraint)
@@ -33,29 +122,81 @@ class Schedule:
         return flattened_constraints
     
     def compute(self):
-        constraints = [
-            self.get_dependency_constraints(),
-            self.get_conflict_constraints(),
-            self.get_default_constraints(),
-            self.get_timeslot_constraints(),
-            self.get_channel_constraints(),
+        families = [
+            ("dependency", self.get_dependency_constraints),
+            ("conflict", self.get_conflict_constraints),
+            ("default", self.get_default_constraints),
+            ("timeslot", self.get_timeslot_constraints),
+            ("channel", self.get_channel_constraints),
         ]
-        self.add_constraint(constraints)
+        if self.symmetry_breaking:
+            families.append(("symmetry", self.get_symmetry_constraints))
+        if self.network.has_repeated_edges():
+            families.append(("occurrence", self.get_occurrence_constraints))
+        if self.uses_makespan() or self.network.has_repeated_edges():
+            families.append(("makespan", self.get_makespan_constraints))
+        self.add_constraint(self.get_family_constraints(families))
         return self.get_constraint()
 
-    def get_default_constraints(self):
+    def compute_structural(self):
+        # Constraints that do not depend on the slotframe size (domain bounds are added separately)
+        families = [
+            ("dependency", self.get_dependency_constraints),
+            ("conflict", self.get_conflict_constraints),
+            ("shared", self.get_shared_constraints),
+            ("timeslot", self.get_timeslot_constraints),
+        ]
+        if not self.two_phase:
+            families.append(("channel", self.get_channel_constraints))
+        if self.symmetry_breaking:
+            families.append(("symmetry", self.get_symmetry_constraints))
+        if self.network.has_repeated_edges():
+            families.append(("occurrence", self.get_occurrence_constraints))
+        if self.uses_makespan() or self.network.has_repeated_edges():
+            families.append(("makespan", self.get_makespan_constraints))
+        self.add_constraint(self.get_family_constraints(families))
+        return self.get_constraint()
+
+    def get_family_constraints(self, families):
+        # Build each constraint family, timed and counted under its name
+        constraints = []
+        for name, get_constraints in families:
+            with self.profiler.timer(f"constraints.{name}"):
+                family = get_constraints()
+            self.profiler.count(f"constraints.{name}", len(family))
+            constraints.append(family)
+        return constraints
+
+    def get_domain_constraints(self, max_slots, max_channels):
         timeslots, channels = self.get_timeslots_channels()
         edges = self.network.get_edges()
-        
+        if self.encoding == "bitvector" and max(max_slots, max_channels) > self.max_value:
+            raise ValueError(f"Slotframe bounds ({max_slots}, {max_channels}) exceed bit-vector encoding bound {self.max_value}")
+
         # Each edge is assigned a timeslot value from 0 to MAX_SLOTS and a channel value from 0 to MAX_CHANNELS
-        time_domain_constraint = [ And(0 <= timeslots[i], timeslots[i] <= self.max_slots) for i in range(len(edges)) ]
-        frequency_domain_constraint = [ And(0 <= channels[i], channels[i] <= self.max_channels) for i in range(len(edges)) ]
+        time_domain_constraint = [ And(0 <= timeslots[i], timeslots[i] <= max_slots) for i in range(len(edges)) ]
+        if self.two_phase:
+            return time_domain_constraint + self.get_capacity_constraints(max_slots, max_channels)
+        frequency_domain_constraint = [ And(0 <= channels[i], channels[i] <= max_channels) for i in range(len(edges)) ]
+        return time_domain_constraint + frequency_domain_constraint
+
+    def get_capacity_constraints(self, max_slots, max_channels):
+        timeslots, _ = self.get_timeslots_channels()
+
+        # Edges sharing a timeslot all need distinct channels, so a timeslot holds at most MAX_CHANNELS + 1 edges
+        return [ AtMost(*[ timeslot == slot for timeslot in timeslots ], max_channels + 1) for slot in range(1, max_slots + 1) ]
+
+    def get_shared_constraints(self):
+        timeslots, _ = self.get_timeslots_channels()
+        edges = self.network.get_edges()
 
         # Timeslot 0 is reserved for shared communications
         shared_constraint = [ timeslots[i] != 0 for i in range(len(edges)) ]
+        return shared_constraint
 
+    def get_default_constraints(self):
         # Add default constraints to the model
-        constraint = time_domain_constraint + frequency_domain_constraint + shared_constraint
+        constraint = self.get_domain_constraints(self.max_slots, self.max_channels) + self.get_shared_constraints()
         self.default_constraints.extend(constraint)
         return self.default_constraints
     
@@ -71,104 +212,119 @@ class Schedule:
     
     def get_dependency_constraints(self):
         timeslots, _ = self.get_timeslots_channels()
-        communications = self.network.get_communication()
-        edges = self.network.get_edges()
-        for edge_u, communication_u in zip(edges, communications):
-            for edge_v, communication_v in zip(edges, communications):
-                _, node_u = communication_u
-                node_v, _ = communication_v
-                if node_u == node_v:
-                    constraints = [ timeslots[self.to_int(edge_u.name)] < timeslots[self.to_int(edge_v.name)] ]
-                    self.dependency_constraints.extend(constraints)
+        for u, v in self.graph.get_dependencies():
+            constraints = [ timeslots[u] < timeslots[v] ]
+            self.dependency_constraints.extend(constraints)
         return self.dependency_constraints
     
-    def get_conflict_constraints(self):
+    def get_occurrence_constraints(self):
         timeslots, _ = self.get_timeslots_channels()
-        communications = self.network.get_communication()
+
+        makespan = self.get_makespan()
         edges = self.network.get_edges()
-        for edge_u, communication_u in zip(edges, communications):
-            for edge_v, communication_v in zip(edges, communications):
-                node_u, node_s = communication_u
-                node_t, node_v = communication_v
-                if (node_u == node_v or node_u == node_t or node_v == node_s) and edge_u != edge_v:
-                    constraints = [ timeslots[self.to_int(edge_u.name)] != timeslots[self.to_int(edge_v.name)] ]
-                    self.conflict_constraints.extend(constraints)  
-
-        # Remove duplicated constraints
-        # for u in range(len(edges)):
-        #     edge_u = edges[u]
-        #     communication_u = communications[u]
-        #     node_u, node_s = communication_u
-        #     for v in range(u, len(edges)):
-        #         edge_v = edges[v]
-        #         communication_v = communications[v]
-        #         node_t, node_v = communication_v
-        #         if (node_u == node_v or node_u == node_t or node_v == node_s) and edge_u != edge_v:
-                    # # constraints = [ timeslots[self.to_int(edge_u.name)] != timeslots[self.to_int(edge_v.name)] ]
-                    # # self.conflict_constraints.extend(constraints)  
-                    # print([ timeslots[self.to_int(edge_u.name)] != timeslots[self.to_int(edge_v.name)] ])  
 
+        # Occurrences of a repeated edge are interchangeable, they are scheduled in order
+        for u, v in self.graph.get_occurrences():
+            self.occurrence_constraints.append(timeslots[u] < timeslots[v])
+
+        # Occurrence k of an edge repeated r times lies in the k-th of r equal windows of the slotframe: k*L < r*t <= (k+1)*L
+        for edge, timeslot in zip(edges, timeslots):
+            occurrence, rate = edge.get_occurrence(), edge.get_rate()
+            if rate > 1:
+                scaled_timeslot, scaled_makespan = self.get_scaled(timeslot, rate), self.get_scaled(makespan, rate)
+                self.occurrence_constraints.extend([
+                    occurrence * scaled_makespan < rate * scaled_timeslot,
+                    rate * scaled_timeslot <= (occurrence + 1) * scaled_makespan,
+                ])
+
+        # The slotframe length L is the makespan, reached by at least one edge
+        self.occurrence_constraints.append(Or([ timeslot == makespan for timeslot in timeslots ]))
+        return self.occurrence_constraints
+
+    def get_scaled(self, variable, rate):
+        # Widen bit-vectors so that multiplying by the rate cannot overflow
+        if self.encoding == "bitvector":
+            return ZeroExt(rate.bit_length() + 1, variable)
+        return variable
+    
+    def get_conflict_constraints(self):
+        timeslots, _ = self.get_timeslots_channels()
+        for u, v in self.graph.get_conflicts():
+            constraints = [ timeslots[u] != timeslots[v] ]
+            self.conflict_constraints.extend(constraints)
         return self.conflict_constraints
     
     def get_timeslot_constraints(self):
         timeslots, _ = self.get_timeslots_channels()
-        communications = self.network.get_communication()
         edges = self.network.get_edges()
-        allowed_timeslot_constraints = []
-        for edge_u, communication_u in zip(edges, communications):
-            for edge_v, communication_v in zip(edges, communications):
-                node_u, node_s = communication_u
-                node_t, node_v = communication_v
-                if (node_u != node_v and node_u != node_t and node_v != node_s) and edge_u != edge_v: # and edge_u.is_forwarding():
-                    allowed_timeslot_constraints.extend([ timeslots[self.to_int(edge_v.name)] != timeslots[self.to_int(edge_u.name)] ])
+        allowed_timeslot_pairs = set()
+        for u, v in self.graph.get_concurrent():
+            allowed_timeslot_pairs.add((v, u))
 
         # Each edge is assigned a unique timeslot value
-        unique_timeslot_constraints = [ timeslots[i] != timeslots[j] for i in range(len(edges)) for j in range(i+1, len(edges)) ]    
+        unique_timeslot_pairs = [ (i, j) for i in range(len(edges)) for j in range(i+1, len(edges)) ]
 
-        # Except for concurrent edges (Remove constraint from unique (distinct) constraint)
-        constraints = [i for i in unique_timeslot_constraints if i not in allowed_timeslot_constraints]
+        # Except for concurrent edges (Remove pair from unique (distinct) pairs before creating constraints)
+        constraints = [ timeslots[i] != timeslots[j] for i, j in unique_timeslot_pairs if (i, j) not in allowed_timeslot_pairs ]
         
         self.timeslot_constraints.extend(constraints)  
         return self.timeslot_constraints
     
     def get_channel_constraints(self):
         timeslots, channels = self.get_timeslots_channels()
-        communications = self.network.get_communication()
-        edges = self.network.get_edges()
         restricted_channel_constraints = []
-        for edge_u, communication_u in zip(edges, communications):
-            for edge_v, communication_v in zip(edges, communications):
-                node_u, node_s = communication_u
-                node_t, node_v = communication_v
-                if (node_u != node_v and node_u != node_t and node_v != node_s) and edge_u != edge_v: # and edge_u.is_forwarding():
-                    restricted_channel_constraints.extend([ 
-                        If(
-                            timeslots[self.to_int(edge_v.name)] == timeslots[self.to_int(edge_u.name)], 
-                            channels[self.to_int(edge_v.name)] != channels[self.to_int(edge_u.name)],
-                            Or(channels[self.to_int(edge_v.name)] != channels[self.to_int(edge_u.name)], channels[self.to_int(edge_v.name)] == channels[self.to_int(edge_u.name)])
-                        )
-                    ]) 
-
-        # Remove duplicated constraints
-        # for u in range(len(edges)):
-        #     edge_u = edges[u]
-        #     communication_u = communications[u]
-        #     node_u, node_s = communication_u
-        #     for v in range(u, len(edges)):
-        #         edge_v = edges[v]
-        #         communication_v = communications[v]
-        #         node_t, node_v = communication_v
-        #         if (node_u != node_v and node_u != node_t and node_v != node_s) and edge_u != edge_v: # and edge_u.is_forwarding():
-        #             restricted_channel_constraints.extend([ 
-        #                 If(
-        #                     timeslots[self.to_int(edge_v.name)] == timeslots[self.to_int(edge_u.name)], 
-        #                     channels[self.to_int(edge_v.name)] != channels[self.to_int(edge_u.name)],
-        #                     Or(channels[self.to_int(edge_v.name)] != channels[self.to_int(edge_u.name)], channels[self.to_int(edge_v.name)] == channels[self.to_int(edge_u.name)])
-        #                 )
-        #             ]) 
+        concurrent_pairs = set()
+        for u, v in self.graph.get_concurrent():
+            # The constraint is symmetric, one per unordered pair is enough
+            if (v, u) in concurrent_pairs:
+                continue
+            concurrent_pairs.add((u, v))
+            restricted_channel_constraints.append(Implies(timeslots[v] == timeslots[u], channels[v] != channels[u]))
 
         # Concurrent edges are assigned different channel offsets (inequality added to constraints)
         constraints = restricted_channel_constraints
 
         self.channel_constraints.extend(constraints)  
         return self.channel_constraints
+
+    def get_makespan_constraints(self):
+        timeslots, _ = self.get_timeslots_channels()
+        makespan = self.get_makespan()
+
+        # No edge is scheduled after the makespan
+        constraints = [ timeslot <= makespan for timeslot in timeslots ]
+        self.makespan_constraints.extend(constraints)
+        return self.makespan_constraints
+
+    def get_symmetry_constraints(self):
+        timeslots, channels = self.get_timeslots_channels()
+        edges = self.network.get_edges()
+
+        # Channels are interchangeable: channel c is used by an edge only if channel c-1 is used by an earlier edge
+        channel_constraints = []
+        if edges and not self.two_phase:
+            channel_constraints.append(channels[0] == 0)
+            max_channel = channels[0]
+            for i in range(1, len(edges)):
+                channel_constraints.append(channels[i] <= max_channel + 1)
+                max_channel = If(channels[i] > max_channel, channels[i], max_channel)
+
+        # Tags with identical anchor sets are interchangeable: order them by the timeslot of their first ranging edge
+        ranging_by_tag = {}
+        for i, edge in enumerate(edges):
+            if edge.is_ranging():
+                ranging_by_tag.setdefault(edge.get_tag().name, []).append((edge.get_anchor().name, i))
+        tags_by_anchors = {}
+        for tag, ranging in ranging_by_tag.items():
+            anchors = tuple(sorted(anchor for anchor, _ in ranging))
+            tags_by_anchors.setdefault(anchors, []).append(tag)
+        tag_constraints = []
+        for tags in tags_by_anchors.values():
+            for tag_u, tag_v in zip(tags, tags[1:]):
+                _, u = min(ranging_by_tag[tag_u])
+                _, v = min(ranging_by_tag[tag_v])
+                tag_constraints.append(timeslots[u] < timeslots[v])
+
+        constraints = channel_constraints + tag_constraints
+        self.symmetry_constraints.extend(constraints)
+        return self.symmetry_constraints
@@ -0,0 +1,210 @@
+import heapq
+import time
+
+from scheduling.communication import Payload
+
+class SimulationMetrics:
+    def __init__(self, slotframe_length, nb_channels, timeslot_duration):
+        self.slotframe_length = slotframe_length
+        self.nb_channels = nb_channels
+        self.timeslot_duration = timeslot_duration
+        # Number of timeslots spent by each node with a given queue depth
+        self.queue_depths = {}
+        # Number of measurements delivered to the root with a given latency (in timeslots)
+        self.latencies = {}
+        # Transmissions and transmissions carrying at least one payload per timeslot of the slotframe
+        self.transmissions = [ 0 ] * slotframe_length
+        self.busy_transmissions = [ 0 ] * slotframe_length
+        # Measurements delivered to the root per slotframe
+        self.deliveries = []
+        self.nb_slotframes = 0
+
+    def record_queues(self, queues, nb_timeslots):
+        for name, depth in queues.items():
+            histogram = self.queue_depths.setdefault(name, {})
+            histogram[depth] = histogram.get(depth, 0) + nb_timeslots
+
+    def record_transmission(self, timeslot, nb_payloads):
+        self.transmissions[timeslot] += 1
+        if nb_payloads > 0:
+            self.busy_transmissions[timeslot] += 1
+
+    def record_delivery(self, payload, asn):
+        latency = asn - payload.asn
+        self.latencies[latency] = self.latencies.get(latency, 0) + 1
+        slotframe = asn // self.slotframe_length
+        if slotframe >= len(self.deliveries):
+            self.deliveries.extend([ 0 ] * (slotframe + 1 - len(self.deliveries)))
+        self.deliveries[slotframe] += 1
+
+    def set_nb_slotframes(self, nb_slotframes):
+        self.nb_slotframes = nb_slotframes
+        if nb_slotframes > len(self.deliveries):
+            self.deliveries.extend([ 0 ] * (nb_slotframes - len(self.deliveries)))
+
+    def get_latency_summary(self):
+        count = sum(self.latencies.values())
+        if count == 0:
+            return {'count': 0}
+        mean = sum(latency * occurrences for latency, occurrences in self.latencies.items()) / count
+        return {
+            'count': count,
+            'mean_timeslots': mean,
+            'min_timeslots': min(self.latencies),
+            'max_timeslots': max(self.latencies),
+            'mean_seconds': mean * self.timeslot_duration,
+        }
+
+    def get_utilisation(self):
+        # Share of the cells of each timeslot (over all channels and simulated slotframes) carrying payloads
+        cells = max(self.nb_slotframes, 1) * self.nb_channels
+        return [ busy / cells for busy in self.busy_transmissions ]
+
+    def to_dict(self):
+        deliveries = self.deliveries[:self.nb_slotframes]
+        return {
+            'nb_slotframes': self.nb_slotframes,
+            'latency': self.get_latency_summary(),
+            'latency_histogram': { str(latency): count for latency, count in sorted(self.latencies.items()) },
+            'queue_depths': {
+                name: { str(depth): count for depth, count in sorted(histogram.items()) }
+                for name, histogram in self.queue_depths.items()
+            },
+            'transmissions': self.transmissions,
+            'busy_transmissions': self.busy_transmissions,
+            'utilisation': self.get_utilisation(),
+            'deliveries_per_slotframe': sum(deliveries) / len(deliveries) if deliveries else 0,
+            'deliveries': deliveries,
+        }
+
+    def to_rows(self):
+        # CSV tables: (name, header, rows)
+        utilisation = self.get_utilisation()
+        return [
+            ("queue_depths", ["node", "depth", "timeslots"], [
+                [ name, depth, count ] for name, histogram in self.queue_depths.items() for depth, count in sorted(histogram.items())
+            ]),
+            ("latencies", ["latency_timeslots", "latency_seconds", "count"], [
+                [ latency, latency * self.timeslot_duration, count ] for latency, count in sorted(self.latencies.items())
+            ]),
+            ("utilisation", ["timeslot", "transmissions", "busy_transmissions", "utilisation"], [
+                [ timeslot, self.transmissions[timeslot], self.busy_transmissions[timeslot], utilisation[timeslot] ] for timeslot in range(self.slotframe_length)
+            ]),
+            ("deliveries", ["slotframe", "delivered"], [
+                [ slotframe, delivered ] for slotframe, delivered in enumerate(self.deliveries[:self.nb_slotframes])
+            ]),
+        ]
+
+
+class TSCHSimulator:
+    def __init__(self, network, slotframe_length, timeslot_duration=0.5, nb_channels=1, root="a1"):
+        self.network = network
+        self.slotframe_length = slotframe_length
+        self.timeslot_duration = timeslot_duration
+        self.root = root
+        self.slot_edges = {}
+        self.nodes = []
+        self.asn = 0
+        self.nb_transmissions = 0
+        self.wall_time = 0.0
+        self.metrics = SimulationMetrics(slotframe_length, nb_channels, timeslot_duration)
+
+    def register_slotframe(self, slotframe):
+        # Assign cells to edges and index edges by timeslot once, the simulation only visits active timeslots
+        self.slot_edges = {}
+        for edge, timeslot, channel in zip(self.network.get_edges(), slotframe.get_timeslot(), slotframe.get_channel()):
+            edge.set_cell(timeslot, channel)
+            self.slot_edges.setdefault(timeslot, []).append(edge)
+        # Nodes are taken from edges, which hold the simulated queues
+        self.nodes = list({ id(node): node for edge in self.network.get_edges() for node in edge.get_nodes() }.values())
+
+    def get_events(self):
+        # Next occurrence (ASN) of each active timeslot from the current ASN on
+        start = self.asn - self.asn % self.slotframe_length
+        events = []
+        for timeslot in self.slot_edges:
+            asn = start + timeslot
+            if asn < self.asn:
+                asn += self.slotframe_length
+            events.append((asn, timeslot))
+        heapq.heapify(events)
+        return events
+
+    def run(self, nb_slotframes=None, realtime=False, verbose=False):
+        # Advance ASN from event to event, as fast as possible or paced by the timeslot duration
+        end_asn = None if nb_slotframes is None else self.asn + nb_slotframes * self.slotframe_length
+        events = self.get_events()
+        start_asn, start_time = self.asn, time.time()
+        if events:
+            first_asn = events[0][0] if end_asn is None else min(events[0][0], end_asn)
+            self.metrics.record_queues(self.get_queues(), first_asn - self.asn)
+        try:
+            while events:
+                asn, timeslot = events[0]
+                if end_asn is not None and asn >= end_asn:
+                    break
+                heapq.heapreplace(events, (asn + self.slotframe_length, timeslot))
+                if realtime:
+                    time.sleep(max(start_time + (asn - start_asn) * self.timeslot_duration - time.time(), 0))
+                self.asn = asn
+                if verbose:
+                    print(f"--- Timeslot {timeslot} (ASN {asn}) ---")
+                for edge in self.slot_edges[timeslot]:
+                    self.transmit(edge, timeslot, verbose)
+
+                # Queues keep their depth until the next active timeslot
+                next_asn = events[0][0] if end_asn is None else min(events[0][0], end_asn)
+                self.metrics.record_queues(self.get_queues(), next_asn - asn)
+            self.asn = end_asn if end_asn is not None else self.asn + 1
+        finally:
+            self.wall_time += time.time() - start_time
+            self.metrics.set_nb_slotframes(self.asn // self.slotframe_length)
+        return self.get_summary()
+
+    def transmit(self, edge, timeslot, verbose=False):
+        node1, node2 = edge.get_node1(), edge.get_node2()
+        # Tags produce timestamped payloads, anchors forward the payloads in their queue
+        payload = None
+        if edge.is_cap():
+            payload = Payload("CAP", node1.name, self.asn)
+        if edge.is_ranging():
+            payload = Payload("ToA", node1.name, self.asn)
+        nb_payloads = (payload is not None) + (len(node1.get_queue()) if node1.is_anchor() else 0)
+        transmission = node1.exchange(node2, payload)
+        self.nb_transmissions += 1
+        self.metrics.record_transmission(timeslot, nb_payloads)
+        if node2.name == self.root:
+            self.deliver(node2)
+        if verbose:
+            cell = edge.get_cell()
+            print(f"{edge}: {transmission} on ts={cell['timeslot']}, ch={cell['channel']}")
+
+    def deliver(self, root):
+        # Measurements reaching the root leave the network
+        for payload in root.get_queue():
+            if payload.kind == "ToA":
+                self.metrics.record_delivery(payload, self.asn)
+        root.delete_forwarded_payload()
+
+    def get_queues(self):
+        # Queue length per node name
+        queues = {}
+        for node in self.nodes:
+            queues[node.name] = queues.get(node.name, 0) + len(node.get_queue())
+        return queues
+
+    def get_metrics(self):
+        return self.metrics
+
+    def get_summary(self):
+        latency = self.metrics.get_latency_summary()
+        return {
+            'asn': self.asn,
+            'nb_slotframes': self.asn // self.slotframe_length,
+            'simulated_time': self.asn * self.timeslot_duration,
+            'wall_time': self.wall_time,
+            'nb_transmissions': self.nb_transmissions,
+            'nb_delivered': latency['count'],
+            'mean_latency': latency.get('mean_seconds'),
+            'queues': self.get_queues(),
+        }
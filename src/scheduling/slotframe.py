@@ -1,35 +1,37 @@
+from array import array
 from prettytable import PrettyTable, ALL
-from scheduling.exception import SharedException, DependencyException, ConcurrencyException
+from scheduling.exception import SharedException, DependencyException, ConcurrencyException, OccurrenceException
 
 class Slotframe:
-    def __init__(self):
-        self.timeslot_assignment = []
-        self.channel_assignment = []
+    # Plain integer arrays (no z3 values), so that solutions can be loaded and checked without a solver
+    __slots__ = ('timeslot_assignment', 'channel_assignment')
+
+    def __init__(self, timeslot_assignment=(), channel_assignment=()):
+        self.timeslot_assignment = array('H', timeslot_assignment)
+        self.channel_assignment = array('H', channel_assignment)
     
     def set_timeslot(self, timeslot_assignment):
-        self.timeslot_assignment = timeslot_assignment
+        self.timeslot_assignment = array('H', timeslot_assignment)
     
     def get_timeslot(self):
         return self.timeslot_assignment
     
     def get_timeslot_to_string(self):
-        timeslot_assignment_to_string = []
-        for timeslot in self.timeslot_assignment:
-            timeslot_assignment_to_string.append(timeslot.as_long())
-        return timeslot_assignment_to_string
+        return self.timeslot_assignment.tolist()
         
     def set_channel(self, channel_assignment):
-        self.channel_assignment = channel_assignment
+        self.channel_assignment = array('H', channel_assignment)
         
     def get_channel(self):
         return self.channel_assignment
     
     def get_channel_to_string(self):
-        channel_assignment_to_string = []
-        for channel in self.channel_assignment:
-            channel_assignment_to_string.append(channel.as_long())
-        return channel_assignment_to_string
+        return self.channel_assignment.tolist()
     
+    def get_slotframe_size(self):
+        # Largest timeslot and channel used, the slotframe itself holds one more timeslot (shared timeslot 0) and channel
+        return max(self.timeslot_assignment, default=0), max(self.channel_assignment, default=0)
+
     def show_as_table(self, edges, communications):
         # List of tuples to display in matrix
         data = self.get_solution(edges, communications)
@@ -62,34 +64,39 @@ class Slotframe:
         data = []
         for timeslot, channel, edge, communication in zip(timeslots, channels, edges, communications):
             value = f"{edge}: {communication[0]} -> {communication[1]}"
-            tuple_solution = (value, int(timeslot.as_long()), int(channel.as_long()))
+            tuple_solution = (value, timeslot, channel)
             data.append(tuple_solution)
         return data
 
     def verify_slotframe(self, edges):
         timeslots, channels = self.get_timeslot(), self.get_channel()
+        length = max(timeslots, default=0)
         errors = []
         for tsi, chi, edgei in zip(timeslots, channels, edges):
             # Check shared constraints
             if not edgei.is_cap() and tsi == 0:
                 error_message = f"Shared error raised with timselot['{edgei}'] = {tsi}"
                 errors.append(SharedException(edgei, error_message))
+            # Check occurrence windows (occurrence k of an edge repeated r times in the k-th of r windows of the slotframe)
+            occurrence, rate = edgei.get_occurrence(), edgei.get_rate()
+            if rate > 1 and not occurrence * length < rate * tsi <= (occurrence + 1) * length:
+                error_message = f"Occurrence error raised with timselot['{edgei}'] = {tsi} outside window {occurrence + 1}/{rate} of {length} timeslots"
+                errors.append(OccurrenceException(edgei, error_message))
             for tsj, chj, edgej in zip(timeslots, channels, edges):
                 nodei1, nodei2 = edgei.get_node1(), edgei.get_node2()
                 nodej1, nodej2 = edgej.get_node1(), edgej.get_node2()
-                # Check dependency constraints
-                if nodei1.is_tag() and nodej1.is_anchor() and nodei2 == nodej1:
-                    if int(tsi.as_long()) >= int(tsj.as_long()):
+                # Check dependency constraints (per occurrence for repeated edges)
+                if nodei1.is_tag() and nodej1.is_anchor() and nodei2 == nodej1 and edgej.get_occurrence() == edgei.get_forwarding_occurrence(edgej.get_rate()):
+                    if tsi >= tsj:
                         error_message = f"Dependency error raised with timselot['{edgei}'] >= timselot['{edgej}']"
                         errors.append(DependencyException(edgei, edgej, error_message))
                 # Check concurrency constraints
-                if edgei != edgej and int(tsi.as_long()) == int(tsj.as_long()):
+                if edgei != edgej and tsi == tsj:
                     nodes = {nodei1, nodei2, nodej1, nodej2}
                     if len(nodes) < 4: 
                         error_message = f"Concurrency error raised with timselot['{edgei}'] = timselot['{edgej}']"
                         errors.append(ConcurrencyException(edgei, edgej, error_message))
-                    if int(chi.as_long()) == int(chj.as_long()):
-                        print(nodei1, nodei2, nodej1, nodej2)
+                    if chi == chj:
                         error_message = f"Concurrency error raised with channel['{edgei}'] = channel['{edgej}']"
                         errors.append(ConcurrencyException(edgei, edgej, error_message))
         return errors
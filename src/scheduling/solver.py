@@ -1,15 +1,76 @@
-from z3 import Or, Sum, Optimize, sat
-from scheduling.schedule import Schedule
+from z3 import And, Bool, Implies, Or, Optimize, Solver, SolverFor, is_bv_value, is_int_value, is_true, set_param, sat, unknown
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+from scheduling.decomposition import CellDecomposition
+from scheduling.heuristic import ChannelColoring, GreedyScheduler
+from scheduling.profiler import Profiler
+from scheduling.schedule import OBJECTIVES, Schedule, get_model_values, get_objective_values, select_encoding, set_solver_timeout
 from scheduling.slotframe import Slotframe
 import time
 
+# Solver configurations: Optimize minimizes the objective, Solver and QF_LIA return the first schedule found
+DEFAULT_CONFIGURATION = {'name': 'optimize', 'solver': 'optimize'}
+PORTFOLIO = [
+    DEFAULT_CONFIGURATION,
+    {'name': 'solver_seed_0', 'solver': 'solver', 'seed': 0},
+    {'name': 'solver_seed_1', 'solver': 'solver', 'seed': 1},
+    {'name': 'qf_lia_seed_2', 'solver': 'qf_lia', 'seed': 2},
+]
+
+def run_portfolio_worker(tsch_solver, connection):
+    # Solve with one configuration and send serializable results back
+    try:
+        seed = tsch_solver.configuration.get('seed')
+        if seed is not None:
+            set_param('smt.random_seed', seed)
+            set_param('sat.random_seed', seed)
+        tsch_solver.run_solver()
+        connection.send(("done", tsch_solver.get_result_summary()))
+    except Exception as error:
+        connection.send(("failed", f"{type(error).__name__}: {error}"))
+    connection.close()
+
 class UWBTSCHSolver:
-    def __init__(self, network, max_solutions, max_slots, max_channels, max_retries):
+    def __init__(self, network, max_solutions, max_slots, max_channels, max_retries, search="linear", portfolio=None, configuration=None, cache=None, warm_start=False, decompose=False, cell_jobs=1, symmetry_breaking=False, encoding="int", two_phase=False, time_budget=None, enumeration="optimize", projection="full", sample_factor=1, solution_sink=None, profiler=None, objective="sum"):
         self.network = network
         self.max_solutions = max_solutions
         self.max_slots = max_slots
         self.max_channels = max_channels
         self.max_retries = max_retries
+        self.search = search
+        self.portfolio = portfolio
+        self.configuration = configuration or DEFAULT_CONFIGURATION
+        self.cache = cache
+        self.warm_start = warm_start
+        self.decompose = decompose
+        self.cell_jobs = cell_jobs
+        self.symmetry_breaking = symmetry_breaking
+        self.encoding = encoding
+        self.two_phase = two_phase
+        self.time_budget = time_budget
+        self.enumeration = enumeration
+        self.projection = projection
+        self.sample_factor = max(sample_factor, 1)
+        self.objective = objective
+        # Streamed solutions are written to the sink as they are found, only the first one is kept in memory
+        self.solution_sink = solution_sink
+        self.nb_solutions = 0
+        # Timers and counters per phase and per retry, z3 statistics and optional function profile
+        self.profiler = profiler or Profiler()
+        self.deadline = None
+        self.timed_out = False
+        self.proven_optimal = None
+        self.solver_lower_bound = None
+        self.objective_handle = None
+        self.heuristic_solution = None
+        self.heuristic_size = None
+        self.heuristic_summary = {}
+        self.probes = {}
+        self.schedule = None
+        self.structural_constraints = []
+        self.bound_literals = {}
+        self.schedule_solver = None
+        self.feasibility_solver = None
         self.model_constraints = []
         self.tsch_parameters = {}
         self.solutions = []
@@ -33,85 +94,520 @@ class UWBTSCHSolver:
     def solutions_to_string(self):
         solutions_to_string = []
         for solution in self.solutions:
-            solution_to_string = {} 
-            solution_to_string['timeslot'] = solution.get_timeslot_to_string()
-            solution_to_string['channel'] = solution.get_channel_to_string()
-            solutions_to_string.append(solution_to_string)
+            solutions_to_string.append(self.solution_to_string(solution))
         return solutions_to_string
 
 
-    def find_feasible_schedules(self, max_slots, max_channels, retries):
-        # Initialize TSCH schedule
-        tsch_schedule = Schedule(self.network, max_slots, max_channels)
-        timeslots, channels = tsch_schedule.get_timeslots_channels()
+    def solution_to_string(self, solution):
+        solution_to_string = {} 
+        solution_to_string['timeslot'] = solution.get_timeslot_to_string()
+        solution_to_string['channel'] = solution.get_channel_to_string()
+        return solution_to_string
+
+
+    def add_solution(self, solution):
+        self.nb_solutions += 1
+        if self.solution_sink is None or not self.solutions:
+            self.solutions.append(solution)
+        if self.solution_sink is not None:
+            self.solution_sink.write(self.solution_to_string(solution))
+
+
+    def set_solutions(self, solutions):
+        # Replace the solutions of the run (solutions already streamed stay in the sink)
+        self.solutions = []
+        self.nb_solutions = 0
+        for solution in solutions:
+            self.add_solution(solution)
+
+
+    def get_solutions_summary(self):
+        # Solutions are listed in the summary, or referenced by file when streamed
+        if self.solution_sink is not None:
+            return {'nb_solutions': self.nb_solutions, 'solutions_file': self.solution_sink.output_file}
+        return {'nb_solutions': self.nb_solutions, 'solutions': self.solutions_to_string()}
+
+
+    def create_schedule_solver(self):
+        # Create the z3 solver described by the configuration
+        solver_type = self.configuration.get('solver', 'optimize')
+        if solver_type == 'optimize':
+            return Optimize()
+        if solver_type == 'qf_lia':
+            return SolverFor("QF_LIA")
+        return Solver()
+
+
+    def get_encoding(self):
+        # Encoding of the schedule model, the QF_LIA solver only accepts integer arithmetic
+        if self.configuration.get('solver') == 'qf_lia':
+            return "int"
+        return select_encoding(self.encoding, len(self.network.get_edges()))
+
+
+    def setup_incremental_solver(self):
+        # Initialize TSCH schedule and solvers once per topology
+        if self.schedule is None:
+            # Bounds never exceed one slot and channel per edge or the bounds reached by retries
+            max_value = max(len(self.network.get_edges()), self.max_slots, self.max_channels) + self.max_retries + 1
+            self.schedule = Schedule(self.network, self.max_slots, self.max_channels, self.symmetry_breaking, self.get_encoding(), max_value, self.two_phase, self.profiler, self.objective)
+
+            # Structural constraints are asserted once, slotframe bounds are guarded by assumption literals
+            self.structural_constraints = self.schedule.compute_structural()
+            with self.profiler.timer("solver_add"):
+                self.schedule_solver = self.create_schedule_solver()
+                self.schedule_solver.add(self.structural_constraints)
+                self.feasibility_solver = Solver()
+                self.feasibility_solver.add(self.structural_constraints)
+
+                # Set objective function to minimize timeslots (terms are minimized in lexicographic order)
+                if isinstance(self.schedule_solver, Optimize):
+                    handles = [ self.schedule_solver.minimize(objective) for objective in self.schedule.get_objectives() ]
+                    self.objective_handle = handles[0]
+        return self.schedule
+
+
+    def reset_incremental_solver(self):
+        # Drop solvers and learned clauses (required when the network topology changes)
+        self.schedule = None
+        self.structural_constraints = []
+        self.bound_literals = {}
+        self.schedule_solver = None
+        self.feasibility_solver = None
+        self.objective_handle = None
+        self.probes = {}
+        self.heuristic_solution = None
+        self.heuristic_size = None
+
+
+    def get_bound_literal(self, max_slots, max_channels):
+        # Assumption literal enabling the domain constraints of a slotframe size
+        key = (max_slots, max_channels)
+        if key not in self.bound_literals:
+            literal = Bool(f"bounds_{max_slots}_{max_channels}")
+            with self.profiler.timer("constraints.domain"):
+                bounds = And(self.schedule.get_domain_constraints(max_slots, max_channels))
+                if self.heuristic_size is not None and max_slots >= self.heuristic_size[0] and max_channels >= self.heuristic_size[1]:
+                    # The greedy slotframe fits these bounds, so the optimum cannot exceed its (first) objective term
+                    heuristic_value = self.schedule.get_objective_values(self.heuristic_solution.get_timeslot_to_string())[0]
+                    bounds = And(bounds, self.schedule.get_objectives()[0] <= heuristic_value)
+            with self.profiler.timer("solver_add"):
+                self.schedule_solver.add(Implies(literal, bounds))
+                self.feasibility_solver.add(Implies(literal, bounds))
+            self.bound_literals[key] = literal
+        return self.bound_literals[key]
+
+
+    def build_result_summary(self, nb_constraints, max_slots, max_channels, retries):
         nodes = self.network.get_nodes()
         edges = self.network.get_edges()
         edges_str = self.network.get_edges_str()
         communications = self.network.get_communication()
-        
-        # Compute and return all model constraints
-        constraints = tsch_schedule.compute()
-        
-        # Create Z3 solver and add constraints
-        solver = Optimize()
-        # solver = Solver()
-        for constraint in constraints:
-            solver.add(constraint)
+        result_summary = {
+            'nb_nodes': len(nodes),
+            'nb_edges': len(edges),
+            'nb_communications': len(communications),
+            'nb_solutions': self.nb_solutions,
+            'nb_constraints': nb_constraints,
+            'nb_slots': max_slots,
+            'nb_channels': max_channels,
+            'nb_retries': retries,
+            'configuration': self.configuration['name'],
+            'encoding': self.get_encoding(),
+            'two_phase': self.two_phase,
+            'objective_function': self.objective,
+            'edges': edges_str,
+            'communications': communications,
+        }
+        rates = self.network.get_rates()
+        if rates:
+            result_summary['rates'] = rates
+        if self.solutions:
+            # Slotframe actually used by the first solution, nb_slots and nb_channels being the solver bounds
+            used_slots, used_channels = self.solutions[0].get_slotframe_size()
+            result_summary['used_slots'] = used_slots
+            result_summary['used_channels'] = used_channels
+            result_summary['slotframe_length'] = used_slots + 1
+        result_summary.update(self.get_solutions_summary())
+        return result_summary
 
-        # Set objective function to minimize timeslot
-        solver.minimize(Sum(timeslots))
+
+    def find_feasible_schedules(self, max_slots, max_channels, retries):
+        # Reuse TSCH schedule and solver across retries
+        self.profiler.start_retry(phase="optimize", retry=retries, max_slots=max_slots, max_channels=max_channels)
+        tsch_schedule = self.setup_incremental_solver()
+        
+        # Enable domain constraints of the requested slotframe size
+        literal = self.get_bound_literal(max_slots, max_channels)
+        constraints = self.structural_constraints + tsch_schedule.get_domain_constraints(max_slots, max_channels)
+        solver = self.schedule_solver
 
         # Evaluate model
         counter = 0
 
-        # Iterate over each pair of slot_assignment and channel_assignment
-        while counter < self.max_solutions and solver.check() == sat:
-            solution = Slotframe()
+        # In fixed enumeration mode the optimizer only provides the first (optimal) schedule
+        max_optimized = 1 if self.enumeration == "fixed" else self.max_solutions
 
-            # Get the model with the assigned values
-            model = solver.model()
-            
-            # Retrieve the assignments for each communication
-            timeslot_values = [ model.evaluate(timeslots[i]) for i in range(len(edges)) ]
-            channel_values = [ model.evaluate(channels[i]) for i in range(len(edges)) ]
+        # Iterate over each pair of slot_assignment and channel_assignment
+        while counter < max_optimized:
+            self.set_solver_timeout(solver)
+            result = self.check_solver(solver, literal)
+            if result == unknown:
+                # Out of time: keep the best schedule found so far by the optimizer, if any
+                self.timed_out = self.deadline is not None
+                with self.profiler.timer("model_extraction"):
+                    model = self.get_best_model(solver, literal) if counter == 0 else None
+                if model is None:
+                    break
+                self.proven_optimal = False
+            elif result == sat:
+                with self.profiler.timer("model_extraction"):
+                    model = solver.model()
+                if counter == 0:
+                    self.proven_optimal = isinstance(solver, Optimize)
+            else:
+                break
 
             # Add the solution to the list
-            solution.set_timeslot(timeslot_values)
-            solution.set_channel(channel_values)
-            self.solutions.append(solution)
+            with self.profiler.timer("model_extraction"):
+                solution = self.get_model_solution(model, max_channels)
+            self.add_solution(solution)
 
             # Add blocking clause to prevent finding the same solution again
-            blocking_clauses = [Or(timeslots[i] != timeslot_values[i], channels[i] != channel_values[i]) for i in range(len(edges))]
-            blocking_clause = Or(blocking_clauses)
-            solver.add(blocking_clause)
+            with self.profiler.timer("solver_add"):
+                solver.add(Implies(literal, self.get_blocking_clause(solution)))
 
             counter += 1
+            if result == unknown:
+                break
+
+        if self.enumeration == "fixed" and counter == 1 and self.max_solutions > 1 and not self.timed_out:
+            self.enumerate_schedules(max_slots, max_channels)
         
-        self.result_summary = {
-            'nb_nodes': len(nodes),
-            'nb_edges': len(edges),
-            'nb_communications': len(communications),
-            'nb_solutions': len(self.solutions),
-            'nb_constraints': len(constraints),
-            'nb_slots': max_slots,
-            'nb_channels': max_channels,
-            'nb_retries': retries,
-            'edges': edges_str,
-            'communications': communications,
-            'solutions': self.solutions_to_string(),
-        }
+        self.profiler.end_retry(nb_solutions=self.nb_solutions, timed_out=self.timed_out)
+        self.result_summary = self.build_result_summary(len(constraints), max_slots, max_channels, retries)
         return self.solutions, self.result_summary
+
+
+    def check_solver(self, solver, *assumptions):
+        # Timed and counted solver check
+        with self.profiler.timer("check"):
+            result = solver.check(*assumptions)
+        self.profiler.count("checks")
+        self.profiler.count(f"checks.{result}")
+        return result
+
+
+    def get_model_solution(self, model, max_channels):
+        # Retrieve the assignments for each communication
+        timeslots, channels = self.schedule.get_timeslots_channels()
+        timeslot_values = get_model_values(model, timeslots)
+        if self.two_phase:
+            # Channels are colored per timeslot, capacity constraints guarantee that they fit MAX_CHANNELS
+            channel_values = ChannelColoring(self.network, max_channels).compute(timeslot_values)
+        else:
+            channel_values = get_model_values(model, channels)
+        return Slotframe(timeslot_values, channel_values)
+
+
+    def get_blocking_clause(self, solution):
+        # Exclude the solution, or every solution with the same timeslots when projected on timeslots
+        timeslots, channels = self.schedule.get_timeslots_channels()
+        timeslot_values, channel_values = solution.get_timeslot(), solution.get_channel()
+        if self.two_phase or self.projection == "timeslots":
+            return Or([ timeslots[i] != timeslot_values[i] for i in range(len(timeslot_values)) ])
+        return Or([ Or(timeslots[i] != timeslot_values[i], channels[i] != channel_values[i]) for i in range(len(timeslot_values)) ])
+
+
+    def enumerate_schedules(self, max_slots, max_channels):
+        # Enumerate further schedules with the objective fixed to the optimal value, using a plain solver
+        objective_values = self.schedule.get_objective_values(self.solutions[0].get_timeslot_to_string())
+        with self.profiler.timer("solver_add"):
+            solver = Solver()
+            solver.add(self.structural_constraints)
+            solver.add(self.schedule.get_domain_constraints(max_slots, max_channels))
+            solver.add([ objective == value for objective, value in zip(self.schedule.get_objectives(), objective_values) ])
+            solver.add(self.get_blocking_clause(self.solutions[0]))
+
+        # Collect sample_factor times more candidates than needed, then keep the most different ones
+        nb_candidates = (self.max_solutions - 1) * self.sample_factor
+        candidates = []
+        while len(candidates) < nb_candidates:
+            self.set_solver_timeout(solver)
+            result = self.check_solver(solver)
+            if result != sat:
+                if result == unknown:
+                    self.timed_out = self.deadline is not None
+                break
+            with self.profiler.timer("model_extraction"):
+                solution = self.get_model_solution(solver.model(), max_channels)
+            candidates.append(solution)
+            with self.profiler.timer("solver_add"):
+                solver.add(self.get_blocking_clause(solution))
+        self.profiler.add_statistics("enumeration_solver", solver)
+        for solution in self.select_diverse_solutions(candidates, self.max_solutions - 1):
+            self.add_solution(solution)
+        return self.solutions
+
+
+    def select_diverse_solutions(self, candidates, count):
+        # Farthest-point sampling: repeatedly keep the candidate with the most timeslots differing from the kept slotframes
+        if len(candidates) <= count:
+            return candidates
+        kept = [ solution.get_timeslot_to_string() for solution in self.solutions ]
+        remaining = [ (solution, solution.get_timeslot_to_string()) for solution in candidates ]
+        distances = [ min(self.get_distance(values, other) for other in kept) for _, values in remaining ]
+        selected = []
+        while len(selected) < count:
+            best = max(range(len(remaining)), key=lambda k: distances[k])
+            solution, values = remaining.pop(best)
+            distances.pop(best)
+            selected.append(solution)
+            distances = [ min(distance, self.get_distance(values, other)) for distance, (_, other) in zip(distances, remaining) ]
+        return selected
+
+
+    def get_distance(self, timeslots_u, timeslots_v):
+        return sum(1 for timeslot_u, timeslot_v in zip(timeslots_u, timeslots_v) if timeslot_u != timeslot_v)
+
+
+    def get_best_model(self, solver, literal):
+        # Model of the last improving schedule found by Optimize before it was interrupted
+        if not isinstance(solver, Optimize):
+            return None
+        try:
+            model = solver.model()
+        except Exception:
+            return None
+        if not is_true(model.evaluate(literal, model_completion=True)):
+            return None
+        lower = self.objective_handle.lower()
+        if is_int_value(lower) or is_bv_value(lower):
+            self.solver_lower_bound = lower.as_long()
+        return model
+
+
+    def get_remaining_time(self):
+        # Seconds left in the time budget, None without budget
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.time(), 0)
+
+
+    def is_expired(self):
+        # True once the time budget is spent or a solver call was interrupted by it
+        remaining = self.get_remaining_time()
+        if remaining is not None and remaining <= 0:
+            self.timed_out = True
+        return self.timed_out
+
+
+    def set_solver_timeout(self, solver):
+        set_solver_timeout(solver, self.get_remaining_time())
+
+
+    def get_objective_lower_bound(self):
+        # Each edge takes at least one timeslot more than the longest dependency chain delivering to it (first objective term)
+        order, predecessors = GreedyScheduler(self.network).get_dependency_order()
+        if order is None:
+            return 0
+        earliest = [ 1 ] * len(order)
+        for u in order:
+            earliest[u] = max([ earliest[v] + 1 for v in predecessors[u] ], default=1)
+        lower_bound = max(earliest, default=0) if OBJECTIVES[self.objective][0] == "makespan" else sum(earliest)
+        return max(lower_bound, self.solver_lower_bound or 0)
+
+
+    def get_optimality_summary(self):
+        # First objective term of the returned slotframe, whether it is proven minimal for its size, and gap to the lower bound
+        objective = get_objective_values(self.objective, self.solutions[0].get_timeslot_to_string())[0]
+        lower_bound = self.get_objective_lower_bound()
+        proven_optimal = bool(self.proven_optimal) or objective <= lower_bound
+        if proven_optimal:
+            lower_bound = objective
+        return {
+            'objective': objective,
+            'lower_bound': lower_bound,
+            'proven_optimal': proven_optimal,
+            'gap': (objective - lower_bound) / objective if objective else 0.0,
+        }
     
 
+    def is_feasible(self, max_slots, max_channels):
+        # Check whether the slotframe size admits a schedule (no objective), unknown when out of time
+        self.profiler.start_retry(phase="probe", max_slots=max_slots, max_channels=max_channels)
+        self.setup_incremental_solver()
+        literal = self.get_bound_literal(max_slots, max_channels)
+        self.set_solver_timeout(self.feasibility_solver)
+        result = self.check_solver(self.feasibility_solver, literal)
+        if result == unknown:
+            self.timed_out = self.deadline is not None
+        self.profiler.end_retry(result=str(result))
+        return result == sat
+
+
+    def probe_slotframe(self, max_slots, max_channels):
+        # Memoize feasibility checks so that each slotframe size is solved at most once
+        key = (max_slots, max_channels)
+        if key not in self.probes:
+            print(f"Probing solver with following configuration: max_slots={max_slots}, max_channels={max_channels}")
+            self.probes[key] = self.is_feasible(max_slots, max_channels)
+        return self.probes[key]
+
+
+    def bisect(self, low, high, is_feasible):
+        # Return the smallest value in [low, high] accepted by is_feasible, high being feasible
+        while low < high:
+            middle = (low + high) // 2
+            if is_feasible(middle):
+                high = middle
+            else:
+                low = middle + 1
+        return high
+
+
+    def search_slotframe_size(self):
+        # Upper bounds: one slot per edge (slot 0 excluded) and one channel per edge, or the greedy slotframe size
+        nb_edges = len(self.network.get_edges())
+        slots_bound = max(nb_edges, self.max_slots)
+        channels_bound = max(nb_edges - 1, self.max_channels)
+        if self.heuristic_size is not None:
+            slots_bound = max(self.heuristic_size[0], self.max_slots)
+            channels_bound = max(self.heuristic_size[1], self.max_channels)
+
+        # Double slots and channels until a feasible slotframe is found
+        max_slots, max_channels = self.max_slots, self.max_channels
+        found = self.probe_slotframe(max_slots, max_channels)
+        doublings = 0
+        while not found and doublings < self.max_retries and not self.is_expired():
+            if max_slots == slots_bound and max_channels == channels_bound:
+                break
+            max_slots = min(max(2 * max_slots, 1), slots_bound)
+            max_channels = min(max(2 * max_channels, 1), channels_bound)
+            found = self.probe_slotframe(max_slots, max_channels)
+            doublings += 1
+        if not found:
+            return False
+
+        # Bisect slots with channels fixed, then channels with the smallest number of slots
+        max_slots = self.bisect(1, max_slots, lambda slots: self.probe_slotframe(slots, max_channels))
+        max_channels = self.bisect(0, max_channels, lambda channels: self.probe_slotframe(max_slots, channels))
+        self.max_slots, self.max_channels = max_slots, max_channels
+        return True
+
+
     def run_solver(self):
         print(f"*** Starting solver")
         # Capture the start time
         start_time = time.time()
+        if self.time_budget is not None:
+            self.deadline = start_time + self.time_budget
+        self.profiler.start()
+
+        # Look up schedules of an unchanged topology before solving
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.get_key(self.network, self.get_cache_parameters())
+            cached_summary = self.cache.get(cache_key)
+            if cached_summary is not None:
+                print(f"Schedule found in cache: {cache_key}")
+                self.load_result_summary(cached_summary)
+                self.result_summary['cache'] = "hit"
+                self.result_summary['processing_time'] = time.time() - start_time
+                self.add_profile()
+                print(f"*** End of solver")
+                return
+
+        # Greedy slotframe bounds the search and serves as fallback (best slotframe so far with a time budget)
+        if (self.warm_start or self.time_budget is not None) and self.search != "greedy" and not self.portfolio:
+            self.run_heuristic()
+
+        if self.portfolio:
+            found = self.run_portfolio()
+        elif self.decompose and self.network.get_cell_edges():
+            found = self.run_decomposition()
+        elif self.search == "greedy":
+            found = self.run_greedy_search()
+        elif self.search == "binary":
+            found = self.run_binary_search()
+        else:
+            found = self.run_linear_search()
+
+        if not found and self.heuristic_solution is not None:
+            print(f"Solver did not find a solution, keeping greedy slotframe")
+            found = self.use_heuristic_solution()
+        if self.heuristic_summary:
+            self.result_summary['heuristic'] = self.heuristic_summary
+        if found:
+            self.result_summary.update(self.get_optimality_summary())
+        if self.time_budget is not None:
+            self.result_summary['time_budget'] = self.time_budget
+            self.result_summary['timed_out'] = self.timed_out
+
+        # Capture the end time and compute the elapsed time
+        end_time = time.time()
+        self.result_summary['processing_time'] = end_time - start_time
+        if not found:
+            self.result_summary['retries'] = "Number of maximum retries reached"
+        elif cache_key is not None and not self.timed_out and self.solution_sink is None:
+            # Schedules cut short by the time budget are not cached, nor streamed solutions (not kept in the summary)
+            self.cache.put(cache_key, self.result_summary)
+            self.result_summary['cache'] = "miss"
+        self.add_profile()
+        print(f"*** End of solver")
 
+
+    def add_profile(self):
+        # Profile of the run (not cached), including the one of the portfolio worker that returned the schedule
+        self.profiler.stop()
+        self.profiler.add_statistics("schedule_solver", self.schedule_solver)
+        self.profiler.add_statistics("feasibility_solver", self.feasibility_solver)
+        profile = self.profiler.get_summary()
+        if 'profile' in self.result_summary:
+            profile['worker'] = self.result_summary['profile']
+        self.result_summary['profile'] = profile
+
+
+    def get_cache_parameters(self):
+        # Solver parameters that may change the schedules returned for a topology
+        return {
+            'max_solutions': self.max_solutions,
+            'max_slots': self.max_slots,
+            'max_channels': self.max_channels,
+            'max_retries': self.max_retries,
+            'search': self.search,
+            'warm_start': self.warm_start,
+            'decompose': self.decompose,
+            'symmetry_breaking': self.symmetry_breaking,
+            'encoding': self.encoding,
+            'two_phase': self.two_phase,
+            'time_budget': self.time_budget,
+            'enumeration': self.enumeration,
+            'projection': self.projection,
+            'sample_factor': self.sample_factor,
+            'objective': self.objective,
+            'configuration': self.configuration['name'],
+            'portfolio': [ configuration['name'] for configuration in self.portfolio ] if self.portfolio else None,
+        }
+
+
+    def load_result_summary(self, result_summary):
+        # Restore solutions and slotframe size from a result summary
+        self.result_summary = dict(result_summary)
+        self.set_solutions(self.solutions_from_string(result_summary['solutions']))
+        if self.solution_sink is not None:
+            del self.result_summary['solutions']
+        self.result_summary.update(self.get_solutions_summary())
+        self.max_slots, self.max_channels = result_summary['nb_slots'], result_summary['nb_channels']
+        self.proven_optimal = result_summary.get('proven_optimal')
+        self.timed_out = result_summary.get('timed_out', False)
+
+
+    def run_linear_search(self):
         # Run solver while solution not found or max retries reached (set to 5)
         found = False
         retries = 0
-        while not found and retries < self.max_retries:
+        while not found and retries < self.max_retries and not self.is_expired():
             print(f"Running solver with following configuration: max_slots={self.max_slots}, max_channels={self.max_channels}, retries={retries}")
             solutions, result_summary = self.find_feasible_schedules(self.max_slots, self.max_channels, retries)
             if len(solutions) > 0:
@@ -120,11 +616,225 @@ class UWBTSCHSolver:
                 self.max_slots += 1 
                 retries += 1
                 self.max_channels += 1 
+        return found
 
-        # Capture the end time and compute the elapsed time
-        end_time = time.time()
-        self.result_summary['processing_time'] = end_time - start_time
+
+    def run_heuristic(self):
+        # Greedy list scheduling over the conflict graph, kept only if the slotframe is valid
+        start_time = time.time()
+        scheduler = GreedyScheduler(self.network)
+        solution = scheduler.compute()
+        if solution is None or solution.verify_slotframe(self.network.get_edges()):
+            print(f"Greedy scheduler did not find a valid slotframe")
+            return False
+        self.heuristic_solution = solution
+        self.heuristic_size = scheduler.get_slotframe_size()
+        self.heuristic_summary = {
+            'nb_slots': self.heuristic_size[0],
+            'nb_channels': self.heuristic_size[1],
+            'processing_time': time.time() - start_time,
+        }
+        print(f"Greedy slotframe found: max_slots={self.heuristic_size[0]}, max_channels={self.heuristic_size[1]}")
+
+        # The greedy slotframe size is known to be feasible
+        self.probes[self.heuristic_size] = True
+        return True
+
+
+    def use_heuristic_solution(self):
+        self.set_solutions([self.heuristic_solution])
+        self.max_slots, self.max_channels = self.heuristic_size
+        self.result_summary = self.build_result_summary(0, self.max_slots, self.max_channels, 0)
+        self.result_summary['configuration'] = "greedy"
+        return True
+
+
+    def run_greedy_search(self):
+        # Greedy slotframe only, without SMT solving
+        if not self.run_heuristic():
+            return False
+        return self.use_heuristic_solution()
+
+
+    def run_decomposition(self):
+        # Solve cells independently, then coordinate cells and forwarding edges in the global slotframe
+        decomposition = CellDecomposition(self.network, self.max_slots, self.max_channels, self.max_retries, self.search, self.cell_jobs, self.objective, self.symmetry_breaking, self.encoding, self.two_phase, self.deadline, self.profiler)
+        with self.profiler.timer("cell_solves"):
+            found = decomposition.solve_cells()
+        self.timed_out = self.timed_out or decomposition.timed_out
+        if not found:
+            return False
+        cell_summary = decomposition.get_cell_summary()
+
+        # The global slotframe holds at least the largest local schedule
+        self.max_slots = max([self.max_slots] + [ cell['nb_slots'] for cell in cell_summary.values() ])
+        self.max_channels = max([self.max_channels] + [ cell['nb_channels'] for cell in cell_summary.values() ])
+        found = False
+        retries = 0
+        solutions = []
+        while not found and retries < self.max_retries and not self.is_expired():
+            print(f"Running coordination with following configuration: max_slots={self.max_slots}, max_channels={self.max_channels}, retries={retries}")
+            with self.profiler.timer("coordination"):
+                solutions = decomposition.coordinate(self.max_slots, self.max_channels, self.max_solutions)
+            self.timed_out = self.timed_out or decomposition.timed_out
+            if solutions:
+                found = True
+            else:
+                self.max_slots += 1
+                self.max_channels += 1
+                retries += 1
+
+        # The coordination is only optimal for the fixed cell schedules (out of retries or time, run_solver falls back to the greedy slotframe)
+        self.set_solutions(solutions)
+        self.proven_optimal = False
+        self.result_summary = self.build_result_summary(len(decomposition.coordination_constraints), self.max_slots, self.max_channels, retries)
+        self.result_summary['decomposition'] = cell_summary
+        return found
+
+
+    def run_binary_search(self):
+        # Find the smallest feasible slotframe, then optimize and enumerate solutions for it
+        found = self.search_slotframe_size()
+        retries = len(self.probes)
+        if not found:
+            self.result_summary['nb_retries'] = retries
+            return False
+        print(f"Running solver with following configuration: max_slots={self.max_slots}, max_channels={self.max_channels}, retries={retries}")
+        solutions, result_summary = self.find_feasible_schedules(self.max_slots, self.max_channels, retries)
+        return len(solutions) > 0
+
+
+    def solutions_from_string(self, solutions_to_string):
+        solutions = []
+        for solution_to_string in solutions_to_string:
+            solutions.append(Slotframe(solution_to_string['timeslot'], solution_to_string['channel']))
+        return solutions
+
+
+    def run_portfolio(self):
+        # Race solver configurations in parallel processes and keep the first valid slotframe
+        running = {}
+        for configuration in self.portfolio:
+            print(f"Starting portfolio configuration: {configuration['name']}")
+            tsch_solver = UWBTSCHSolver(self.network, self.max_solutions, self.max_slots, self.max_channels, self.max_retries, self.search, configuration=configuration, warm_start=self.warm_start, decompose=self.decompose, cell_jobs=self.cell_jobs, symmetry_breaking=self.symmetry_breaking, encoding=self.encoding, two_phase=self.two_phase, time_budget=self.time_budget, enumeration=self.enumeration, projection=self.projection, sample_factor=self.sample_factor, objective=self.objective)
+            receiver, sender = Pipe(duplex=False)
+            process = Process(target=run_portfolio_worker, args=(tsch_solver, sender))
+            process.start()
+            sender.close()
+            running[receiver] = (configuration, process)
+
+        found = False
+        while running and not found:
+            for receiver in wait(list(running)):
+                configuration, process = running.pop(receiver)
+                try:
+                    status, result_summary = receiver.recv()
+                except EOFError:
+                    status, result_summary = "failed", None
+                process.join()
+                if status != "done" or not result_summary.get('nb_solutions'):
+                    print(f"Portfolio configuration {configuration['name']} did not find a solution")
+                    continue
+
+                # Keep the first configuration whose solutions are all valid
+                solutions = self.solutions_from_string(result_summary['solutions'])
+                if any(solution.verify_slotframe(self.network.get_edges()) for solution in solutions):
+                    print(f"Portfolio configuration {configuration['name']} returned an invalid slotframe")
+                    continue
+                print(f"Portfolio configuration {configuration['name']} found a solution first")
+                self.load_result_summary(result_summary)
+                found = True
+                break
+
+        # Cancel remaining configurations
+        for configuration, process in running.values():
+            process.terminate()
+            process.join()
+        self.result_summary['portfolio'] = [ configuration['name'] for configuration in self.portfolio ]
+        return found
+
+
+    def reschedule(self, slotframe, delta):
+        # Repair a slotframe after a topology change, keeping cells of unaffected edges where feasible
+        print(f"*** Starting rescheduling")
+        start_time = time.time()
+        # The budget of the previous run is spent, the repair gets a time budget of its own
+        self.deadline = start_time + self.time_budget if self.time_budget is not None else None
+        self.timed_out = False
+        previous_edges = self.network.get_edges()
+        previous_cells = {
+            edge: (timeslot, channel)
+            for edge, timeslot, channel in zip(previous_edges, slotframe.get_timeslot_to_string(), slotframe.get_channel_to_string())
+        }
+
+        # Apply topology delta, solver state built for the previous topology is no longer valid
+        self.network.apply_delta(delta)
+        self.reset_incremental_solver()
+        edges = self.network.get_edges()
+        graph = self.network.get_conflict_graph()
+
+        # Widen the set of edges to re-solve: new edges, then their conflicting edges, then all edges
+        affected = { i for i, edge in enumerate(edges) if edge not in previous_cells }
+        neighbourhood = affected | { j for i in affected for j in graph.get_neighbours(i) }
+        repairs = [("affected", affected), ("neighbourhood", neighbourhood), ("all", set(range(len(edges))))]
+
+        found = False
+        for repair, free_edges in repairs:
+            print(f"Rescheduling {len(free_edges)} edge(s) ({repair}) with max_slots={self.max_slots}, max_channels={self.max_channels}")
+            solution, nb_constraints = self.repair_slotframe(previous_cells, free_edges)
+            if solution is not None:
+                self.set_solutions([solution])
+                self.result_summary = self.build_result_summary(nb_constraints, self.max_slots, self.max_channels, 0)
+                self.result_summary['repair'] = repair
+                self.result_summary['nb_rescheduled'] = len(free_edges)
+                found = True
+                break
+
+        # Search a larger slotframe when no repair fits the current one
+        if not found:
+            print(f"No repair found within current slotframe, running full solver")
+            # Summary of the changed topology without solution, replaced by the one of the solver if it runs
+            self.set_solutions([])
+            self.result_summary = self.build_result_summary(0, self.max_slots, self.max_channels, 0)
+            self.max_slots += 1
+            self.max_channels += 1
+            if self.search == "binary":
+                found = self.run_binary_search()
+            else:
+                found = self.run_linear_search()
+            self.result_summary['repair'] = "full"
+
+        if self.time_budget is not None:
+            self.result_summary['time_budget'] = self.time_budget
+            self.result_summary['timed_out'] = self.timed_out
+        self.result_summary['processing_time'] = time.time() - start_time
         if not found:
             self.result_summary['retries'] = "Number of maximum retries reached"
-        print(f"*** End of solver")
-    
\ No newline at end of file
+        self.add_profile()
+        print(f"*** End of rescheduling")
+        return found
+
+
+    def repair_slotframe(self, previous_cells, free_edges):
+        # Solve the current slotframe size with every edge outside free_edges fixed to its previous cell
+        tsch_schedule = Schedule(self.network, self.max_slots, self.max_channels)
+        timeslots, channels = tsch_schedule.get_timeslots_channels()
+        edges = self.network.get_edges()
+        constraints = tsch_schedule.compute()
+        for i, edge in enumerate(edges):
+            if i not in free_edges:
+                timeslot, channel = previous_cells[edge]
+                constraints = constraints + [ timeslots[i] == timeslot, channels[i] == channel ]
+
+        # Plain solver: a repair only needs to be feasible
+        solver = Solver()
+        solver.add(constraints)
+        self.set_solver_timeout(solver)
+        result = self.check_solver(solver)
+        self.profiler.add_statistics("repair_solver", solver)
+        if result != sat:
+            return None, len(constraints)
+
+        model = solver.model()
+        solution = Slotframe(get_model_values(model, timeslots), get_model_values(model, channels))
+        return solution, len(constraints)
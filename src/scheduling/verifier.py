@@ -0,0 +1,121 @@
+import numpy as np
+from scheduling.exception import SharedException, DependencyException, ConcurrencyException, LengthException, OccurrenceException
+
+class SlotframeVerifier:
+    def __init__(self, edges, chunk_size=4096):
+        self.edges = edges
+        self.chunk_size = chunk_size
+        self.shared = None
+        self.dependencies = None
+        self.pairs = None
+        self.node_conflicts = None
+        self.occurrences = None
+        self.rates = None
+        self.build()
+
+    def build(self):
+        # Precompute edge index arrays for the rules of Slotframe.verify_slotframe
+        shared = []
+        dependencies = []
+        pairs = []
+        node_conflicts = []
+        occurrences = []
+        rates = []
+        for i, edgei in enumerate(self.edges):
+            nodei1, nodei2 = edgei.get_node1(), edgei.get_node2()
+            shared.append(not edgei.is_cap())
+            occurrences.append(edgei.get_occurrence())
+            rates.append(edgei.get_rate())
+            for j, edgej in enumerate(self.edges):
+                nodej1, nodej2 = edgej.get_node1(), edgej.get_node2()
+                # Ranging edge delivering to the anchor that forwards on edge j (per occurrence for repeated edges)
+                if nodei1.is_tag() and nodej1.is_anchor() and nodei2 == nodej1 and edgej.get_occurrence() == edgei.get_forwarding_occurrence(edgej.get_rate()):
+                    dependencies.append((i, j))
+                # Edges sharing a timeslot need distinct channels, and must not share a node
+                if i < j and edgei != edgej:
+                    pairs.append((i, j))
+                    node_conflicts.append(len({nodei1, nodei2, nodej1, nodej2}) < 4)
+        self.shared = np.array(shared, dtype=bool)
+        self.dependencies = np.array(dependencies, dtype=np.intp).reshape(-1, 2)
+        self.pairs = np.array(pairs, dtype=np.intp).reshape(-1, 2)
+        self.node_conflicts = np.array(node_conflicts, dtype=bool)
+        self.occurrences = np.array(occurrences, dtype=np.int64)
+        self.rates = np.array(rates, dtype=np.int64)
+
+    def verify(self, timeslots, channels):
+        # Violation matrices with one row per solution: per edge (shared, occurrence) or per edge pair (dependency, concurrency, channel)
+        first, second = self.pairs[:, 0], self.pairs[:, 1]
+        shared = (timeslots == 0) & self.shared
+        length = timeslots.max(axis=1, initial=0)[:, None].astype(np.int64)
+        scaled = self.rates * timeslots
+        occurrence = (self.rates > 1) & ~((self.occurrences * length < scaled) & (scaled <= (self.occurrences + 1) * length))
+        dependency = timeslots[:, self.dependencies[:, 0]] >= timeslots[:, self.dependencies[:, 1]]
+        same_slot = timeslots[:, first] == timeslots[:, second]
+        concurrency = same_slot & self.node_conflicts
+        channel = same_slot & (channels[:, first] == channels[:, second])
+        return shared, dependency, concurrency, channel, occurrence
+
+    def verify_solutions(self, solutions):
+        # Check solutions ({'timeslot': [...], 'channel': [...]}) chunk by chunk, yield (index, errors) of invalid ones
+        chunk = []
+        offset = 0
+        for solution in solutions:
+            chunk.append(solution)
+            if len(chunk) == self.chunk_size:
+                yield from self.verify_chunk(chunk, offset)
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            yield from self.verify_chunk(chunk, offset)
+
+    def verify_chunk(self, chunk, offset):
+        # Solutions with one value per edge are checked together, the others only get a length error
+        errors = {}
+        rows = []
+        for k, solution in enumerate(chunk):
+            length_errors = self.get_length_errors(solution)
+            if length_errors:
+                errors[k] = length_errors
+            else:
+                rows.append(k)
+        if rows:
+            timeslots = np.array([ chunk[k]['timeslot'] for k in rows ], dtype=np.int32).reshape(len(rows), len(self.edges))
+            channels = np.array([ chunk[k]['channel'] for k in rows ], dtype=np.int32).reshape(len(rows), len(self.edges))
+            violations = self.verify(timeslots, channels)
+            invalid = np.zeros(len(rows), dtype=bool)
+            for violation in violations:
+                invalid |= violation.any(axis=1)
+            for r in np.flatnonzero(invalid):
+                errors[rows[r]] = self.get_errors(timeslots[r], *[ violation[r] for violation in violations ])
+        for k in sorted(errors):
+            yield offset + k, errors[k]
+
+    def get_length_errors(self, solution):
+        # A stored solution of another topology does not have one timeslot and one channel per edge
+        errors = []
+        for name in ('timeslot', 'channel'):
+            found = len(solution[name])
+            if found != len(self.edges):
+                errors.append(LengthException(len(self.edges), found, f"Length error raised with {found} values in {name} for {len(self.edges)} edges"))
+        return errors
+
+    def get_errors(self, timeslots, shared, dependency, concurrency, channel, occurrence):
+        # Exceptions of one solution, with the messages of Slotframe.verify_slotframe
+        errors = []
+        for i in np.flatnonzero(shared):
+            edge = self.edges[i]
+            errors.append(SharedException(edge, f"Shared error raised with timselot['{edge}'] = {timeslots[i]}"))
+        for i, j in self.dependencies[dependency]:
+            edgei, edgej = self.edges[i], self.edges[j]
+            errors.append(DependencyException(edgei, edgej, f"Dependency error raised with timselot['{edgei}'] >= timselot['{edgej}']"))
+        for i, j in self.pairs[concurrency]:
+            edgei, edgej = self.edges[i], self.edges[j]
+            errors.append(ConcurrencyException(edgei, edgej, f"Concurrency error raised with timselot['{edgei}'] = timselot['{edgej}']"))
+        for i, j in self.pairs[channel]:
+            edgei, edgej = self.edges[i], self.edges[j]
+            errors.append(ConcurrencyException(edgei, edgej, f"Concurrency error raised with channel['{edgei}'] = channel['{edgej}']"))
+        length = max(timeslots, default=0)
+        for i in np.flatnonzero(occurrence):
+            edge = self.edges[i]
+            errors.append(OccurrenceException(edge, f"Occurrence error raised with timselot['{edge}'] = {timeslots[i]} outside window {self.occurrences[i] + 1}/{self.rates[i]} of {length} timeslots"))
+        return errors
@@ -1,13 +1,13 @@
 import argparse
 import json
 import os
-from z3 import IntVal
 
 from scheduling.network import NetworkTopology
 from scheduling.node import Tag, Anchor
 from scheduling.slotframe import Slotframe
+from scheduling.verifier import SlotframeVerifier
 
-from utils.files import read_from_json, get_topology_files
+from utils.files import read_from_json, read_from_jsonl, get_topology_files
 
 class Main:
     def __init__(self):
@@ -15,28 +15,30 @@ class Main:
 
     def setup_network_topology(self, input_file):
         cells = read_from_json(input_file)
+        tag_rates = {}
+        edge_rates = {}
 
-        for _, cell_value in cells.items():
+        for cell_name, cell_value in cells.items():
             tags = cell_value.get("tags", [])
             anchors = cell_value.get("anchors", [])
             parent =  cell_value.get("parent", "")
             next_parent =  cell_value.get("next_parent", "")
-
-            # Initialize nodes
-            tag_nodes = [ Tag(tag) for tag in tags ]
-            anchors_nodes = [ Anchor(anchors) for anchors in anchors ]
-
-            # Add nodes to network topology
+            # Optional rates (cells per slotframe) of tags and edges, 1 by default
+            tag_rates.update(cell_value.get("rates", {}))
+            for node1, node2, rate in cell_value.get("edge_rates", []):
+                edge_rates[(node1, node2)] = rate
+
+            # Initialize nodes, nodes shared with previous cells are taken from the network topology
+            tag_nodes = [ self.get_node(tag, Tag) for tag in tags ]
+            anchors_nodes = [ self.get_node(anchor, Anchor) for anchor in anchors ]
             nodes = anchors_nodes + tag_nodes
+
+            # Set parent node (shared nodes keep the parent given by the first cell declaring them)
+            parent_node = self.network.find_node_by_name(parent)
+            next_parent_node = self.network.find_node_by_name(next_parent)
             for node in nodes:
-                found = self.network.find_node_by_name(node.name)
-                if found is None:
-                    self.network.add_node(node)
-            
-            # Set parent node
-            for node in nodes:
-                parent_node = self.network.find_node_by_name(parent)
-                next_parent_node = self.network.find_node_by_name(next_parent)
+                if node.get_parent() is not None:
+                    continue
                 if node == parent_node:
                     node.set_parent(next_parent_node)
                 else:
@@ -45,33 +47,48 @@ class Main:
             # Add ranging communications
             for tag_node in tag_nodes:
                 for anchor_node in anchors_nodes:
-                    self.network.add_edges(tag_node, anchor_node)
+                    self.network.add_edges(tag_node, anchor_node, cell_name)
 
-            # Add forwarding communications
-            self.setup_forwarding_tree()
+        # Add forwarding communications once all cells are loaded
+        self.network.setup_forwarding_tree()
 
-    def traverse_node_tree(self, node, root):
-        if node.is_anchor() and node.name != root:
-            self.network.add_edges(node, node.parent)
-            self.traverse_node_tree(node.parent, root)
+        # Repeat edges required more than once per slotframe
+        self.network.set_rates(tag_rates, edge_rates)
 
-    def setup_forwarding_tree(self):
-        root = "a1"
-        for node in self.network.get_nodes():
-            if node.is_anchor() and node.name != root:
-                self.traverse_node_tree(node, root)
+    def get_node(self, name, node_type):
+        node = self.network.find_node_by_name(name)
+        if node is None:
+            node = node_type(name)
+            self.network.add_node(node)
+        return node
+
+    def get_solutions_file(self, output_path, topology_file):
+        # Streamed solutions are referenced in the logs, otherwise they are stored in solutions.json
+        try:
+            logs = read_from_json(f"{output_path}/logs.json")
+        except FileNotFoundError:
+            logs = {}
+        results = logs.get(os.path.basename(topology_file), {})
+        return results.get('solutions_file', f"{output_path}/solutions.json")
 
     def test_all_solutions(self, input_file):
-        solutions = read_from_json(input_file)
-        for solution in solutions:
-            slotframe = self.convert_schedule(solution)
-            result = self.test_solution(slotframe)
-            if result == "Test failed":
-                return result
-        return "All tests passed" 
+        if input_file.endswith(".jsonl"):
+            solutions = read_from_jsonl(input_file)
+        else:
+            solutions = read_from_json(input_file)
+
+        # Check all solutions at once with the batched verifier, reporting violations per solution
+        verifier = SlotframeVerifier(self.network.get_edges())
+        status = "All tests passed"
+        for index, errors in verifier.verify_solutions(solutions):
+            print(f"Schedule {index} broke at least one constraint. \nThe following errors were detected:")
+            for error in errors:
+                print(f"-- {type(error).__name__}: {error}")
+            status = "Test failed"
+        return status
 
     def test_solution(self, solution):
-        errors = solution.verify_slotframe(network.get_edges())
+        errors = solution.verify_slotframe(self.network.get_edges())
         if errors:
             print(f"Schedule broke at least one constraint. \nThe following errors were detected:")
             for error in errors:
@@ -79,6 +96,53 @@ class Main:
             return "Test failed"
         return "Test passed"
 
+    def test_portfolio(self):
+        # Run every portfolio configuration on its own, each one must return valid slotframes
+        # Imported here since the other tests only check stored solutions (without z3)
+        from scheduling.solver import UWBTSCHSolver, PORTFOLIO
+        status = "All tests passed"
+        for configuration in PORTFOLIO:
+            tsch_solver = UWBTSCHSolver(self.network, 1, 4, 1, 10, encoding="auto", configuration=configuration)
+            try:
+                tsch_solver.run_solver()
+            except Exception as error:
+                print(f"Configuration {configuration['name']} failed: {type(error).__name__}: {error}")
+                status = "Test failed"
+                continue
+            solutions = tsch_solver.get_solutions()
+            if not solutions:
+                print(f"Configuration {configuration['name']} did not find a solution")
+                status = "Test failed"
+            for solution in solutions:
+                if self.test_solution(solution) != "Test passed":
+                    status = "Test failed"
+        return status
+
+    def test_delta(self, delta):
+        # Schedule the topology, apply the topology change, then test the forwarding tree and the repaired slotframe
+        # Imported here since the other tests only check stored solutions (without z3)
+        from scheduling.solver import UWBTSCHSolver
+        tsch_solver = UWBTSCHSolver(self.network, 1, 4, 1, 10)
+        tsch_solver.run_solver()
+        solutions = tsch_solver.get_solutions()
+        if not solutions:
+            print(f"No slotframe found before the topology change")
+            return "Test failed"
+        if not tsch_solver.reschedule(solutions[0], delta):
+            print(f"No slotframe found after the topology change")
+            return "Test failed"
+        print(f"Slotframe repaired ({tsch_solver.get_result_summary()['repair']}): {tsch_solver.get_solutions()[0].get_timeslot_to_string()}")
+
+        status = "All tests passed"
+        for node in self.network.get_nodes():
+            if node.is_anchor() and node.get_parent() not in (None, node) and self.network.find_edge(node.name, node.get_parent().name, "forwarding") is None:
+                print(f"Anchor {node} does not forward to its parent {node.get_parent()}")
+                status = "Test failed"
+        for solution in tsch_solver.get_solutions():
+            if self.test_solution(solution) != "Test passed":
+                status = "Test failed"
+        return status
+
     def convert_schedule(self, arg):
         try:
             if type(arg) is str:
@@ -88,12 +152,7 @@ class Main:
             else:
                 print("Argument provided is neither a string or dict")
                 return None
-            solution = Slotframe()
-            timeslot_values = [ IntVal(ts) for ts in schedule["timeslot"] ]
-            channel_values = [ IntVal(ch) for ch in schedule["channel"] ]
-            solution.set_timeslot(timeslot_values)
-            solution.set_channel(channel_values)
-            return solution
+            return Slotframe(schedule["timeslot"], schedule["channel"])
         except Exception:
             return None
 
@@ -103,6 +162,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="")
     parser.add_argument("--topology", type=str, default="default", help="run test for specified topology")
     parser.add_argument("--all", action='store_true', help="run test for all solutions generated by main")
+    parser.add_argument("--portfolio", action='store_true', help="run every portfolio configuration and test its solutions")
+    parser.add_argument("--delta", type=str, default="", help="schedule the topology, apply the topology change of the specified file and test the repaired slotframe")
     parser.add_argument("--solution", type=str, default="", help="run test for the solution provided by user")
     args = parser.parse_args()
 
@@ -131,9 +192,17 @@ if __name__ == "__main__":
         # Run tests
         if args.all:
             print(f"*** Starting test for all solutions")
-            solutions_file = f"{output_path}/solutions.json"
+            solutions_file = main.get_solutions_file(output_path, topology_file)
             status = main.test_all_solutions(solutions_file)
             print(f"{status} \n *** End of testing")
+        elif args.portfolio:
+            print(f"*** Starting test for portfolio configurations")
+            status = main.test_portfolio()
+            print(f"{status} \n *** End of testing")
+        elif args.delta:
+            print(f"*** Starting test for topology change: {args.delta}")
+            status = main.test_delta(read_from_json(args.delta))
+            print(f"{status} \n *** End of testing")
         elif args.solution:
             print(f"*** Starting test for solution: {args.solution}")
             slotframe = main.convert_schedule(args.solution)
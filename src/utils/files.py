@@ -1,5 +1,7 @@
+import csv
 import json
 import os
+import time
 
 def read_from_json(input_file):
     # Read JSON file with topology definition
@@ -12,6 +14,22 @@ def write_to_json(data, output_file):
     with open(output_file, 'w') as file:
         json.dump(data, file, indent=2, separators=(',',': '))
 
+def read_from_jsonl(input_file):
+    # Read JSON Lines file one record at a time, a truncated last line (interrupted writer) is ignored
+    with open(input_file, 'r') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+def write_to_csv(header, rows, output_file):
+    # Write rows as CSV with a header line
+    with open(output_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
 def write_to_text(data, output_file):
     # Write output to text file
     with open(output_file, 'w') as file:
@@ -27,4 +45,29 @@ def get_topology_files(path):
     for file in sorted(os.listdir(path)):
         if file.endswith(".json"):
             topology_files.append(os.path.join(path, file))
-    return topology_files
\ No newline at end of file
+    return topology_files
+
+class JsonLinesWriter:
+    def __init__(self, output_file, flush_interval=1.0):
+        # Write one JSON record per line, flushed to disk at most every flush_interval seconds
+        self.output_file = output_file
+        self.flush_interval = flush_interval
+        self.nb_records = 0
+        self.file = open(output_file, 'w')
+        self.last_flush = time.time()
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(',',':')) + "\n")
+        self.nb_records += 1
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = time.time()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()